@@ -1,43 +1,175 @@
-import os
+import json
+import time
 import logging
 from io import BytesIO
 from celery import shared_task
-from openai import OpenAI
+from celery.signals import worker_process_init, worker_ready
+from celery.concurrency.prefork import TaskPool as PreforkPool
+from openai import APITimeoutError, APIConnectionError, RateLimitError, InternalServerError, NotFoundError
+from openai.types.chat import ChatCompletion
 from dotenv import load_dotenv
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-import markdown2
-from logging.handlers import RotatingFileHandler
+from logging_config import configure_logging
 from s3_utils import get_s3_client, download_file_from_s3_to_memory, upload_bytes_to_s3
-from utils import extract_text_from_pdf_bytes
+from utils import extract_pages_from_pdf_bytes, join_pages
 from config import config
 from utils import simple_markdown_to_pdf
-print(f"simple_markdown_to_pdf function: {simple_markdown_to_pdf}")
+from progress import ReportProgress, record_token_usage
+from report_cache import mark_report_exists, is_report_marked
+from botocore.exceptions import ClientError
+from metrics import timed, record_token_cost, inc
+from model_routing import get_route, route_models
+from hedging import hedged_call, hedge_delay, record_latency, DeadlineExceeded
+from llm_recording import CAPTURE_MODE, record_call, replay_call
+from openai_pool import get_openai_client, prewarm
+from memory_profile import over_ceiling, shed_inputs
+from blob_store import get_blob_text, save_blob_text
+from text_sidecar import sidecar_key, read_sidecar, write_sidecar
+from pdf_preflight import PDF_MAX_PAGES, preflight_pdf, limit_problems, is_image_only
+from tracing import start_span, task_traceparent
+from report_state import save_texts, save_text, load_texts, save_section, load_sections, clear_report_state
+from report_workflow import SECTION_NAMES, INDEPENDENT_SECTIONS, DEPENDENT_SECTIONS, WORKFLOW_STAGES, STAGE_PLANS, input_name, fire_ready_gates
+from progress import set_status, get_status, publish_progress, has_failed
+
+# Set up logging (records are written by a background thread, see logging_config)
+logger = configure_logging(logging.getLogger('report_generator'), 'report_generator.log')
 
-# Set up logging
-log_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(funcName)s - %(message)s')
-log_file = 'report_generator.log'
-log_handler = RotatingFileHandler(log_file, maxBytes=1024 * 1024 * 100, backupCount=20)
-log_handler.setFormatter(log_formatter)
-log_handler.setLevel(logging.DEBUG)
+# Load environment variables
+load_dotenv()
 
-logger = logging.getLogger('report_generator')
-logger.setLevel(logging.DEBUG)
-logger.addHandler(log_handler)
+# Failures worth retrying on the next model of a section's route
+FALLBACK_ERRORS = (DeadlineExceeded, APITimeoutError, APIConnectionError, RateLimitError, InternalServerError, NotFoundError)
 
-# Also log to console
-console_handler = logging.StreamHandler()
-console_handler.setFormatter(log_formatter)
-console_handler.setLevel(logging.INFO)
-logger.addHandler(console_handler)
+SECTION_COUNT = len(SECTION_NAMES)
+CHARS_PER_TOKEN = 4  # rough estimate for English text
+REPORT_STAGES = ['download', 'extract'] + [f'section:{name}' for name in SECTION_NAMES] + ['render', 'upload']
 
-# Load environment variables
-load_dotenv()
 
-# Initialize API client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+@worker_process_init.connect
+def prewarm_child_process(**kwargs):
+    # Prefork (and solo) pools: each process opens its own connections after the fork
+    prewarm()
+
+
+@worker_ready.connect
+def prewarm_main_process(sender, **kwargs):
+    # Thread and gevent pools run tasks in the worker's main process; a prefork parent
+    # never calls the API, and connections it opened would leak into later children
+    if not isinstance(sender.pool, PreforkPool):
+        prewarm()
+
+
+def chat_completion(section, **kwargs):
+    """Run a chat completion for `section` on the model its route selects (see model_routing),
+    moving down the route's fallback chain when a model times out or is unavailable."""
+    route = get_route(section)
+    models = route_models(route)
+    for attempt, model in enumerate(models):
+        try:
+            response = _chat_completion_call(section, model, route, **kwargs)
+        except FALLBACK_ERRORS as e:
+            inc('par_openai_requests_total', section=section, model=model, outcome='error')
+            if attempt == len(models) - 1:
+                raise
+            logger.warning(f"Model {model} failed for {section} ({type(e).__name__}: {e}), falling back to {models[attempt + 1]}")
+            continue
+        inc('par_openai_requests_total', section=section, model=model, outcome='fallback' if attempt else 'ok')
+        return response
+
+
+def _chat_completion_call(section, model, route, **kwargs):
+    started = time.perf_counter()
+    if CAPTURE_MODE == 'replay':
+        response = _replay_completion(section, model, **kwargs)
+    else:
+        response = _hedged_completion(section, model, route, **kwargs)
+    if CAPTURE_MODE == 'record':
+        usage = response.usage.model_dump() if response.usage else None
+        choice = response.choices[0]
+        record_call(section, model, {**kwargs, 'max_tokens': route['max_tokens']}, choice.message.content,
+                    choice.finish_reason, usage, time.perf_counter() - started)
+    if response.usage:
+        record_token_usage(response.usage.total_tokens)
+        record_token_cost(section, model, response.usage.prompt_tokens, response.usage.completion_tokens)
+    return response
+
+
+def _hedged_completion(section, model, route, **kwargs):
+    # The route timeout is the deadline for the whole call, hedge included (see hedging)
+    def attempt(cancelled):
+        with start_span('openai.chat.completions', section=section, model=model) as span, \
+                timed('par_openai_request_duration_seconds', section=section, model=model):
+            response = _stream_completion(model, route, cancelled, **kwargs)
+            if response.usage:
+                span.set_attribute('tokens.prompt', response.usage.prompt_tokens)
+                span.set_attribute('tokens.completion', response.usage.completion_tokens)
+            return response
+
+    def discarded(response):
+        _record_discarded_attempt(section, model, kwargs['messages'], response)
+
+    started = time.perf_counter()
+    response, hedged, hedge_won = hedged_call(attempt, route['timeout'], hedge_delay(section, model), on_discarded=discarded)
+    record_latency(section, model, time.perf_counter() - started)
+    if hedged:
+        inc('par_openai_hedges_total', section=section, model=model, winner='hedge' if hedge_won else 'primary')
+    return response
+
+
+def _record_discarded_attempt(section, model, messages, response):
+    # An attempt whose result was not used (the loser of a hedge) is billed all the same:
+    # exactly if it finished, estimated from the text sent and received if it was cut off
+    if response.usage:
+        prompt_tokens, completion_tokens = response.usage.prompt_tokens, response.usage.completion_tokens
+    else:
+        prompt_tokens = estimate_tokens(json.dumps(messages))
+        completion_tokens = estimate_tokens(response.choices[0].message.content or '')
+    record_token_cost(section, model, prompt_tokens, completion_tokens, discarded='true')
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def _replay_completion(section, model, **kwargs):
+    # Served from a capture (see llm_recording); spans and metrics are kept so replayed
+    # runs can be compared with live ones
+    with start_span('openai.chat.completions', section=section, model=model, replay=True), \
+            timed('par_openai_request_duration_seconds', section=section, model=model):
+        record = replay_call(section, kwargs['messages'])
+    return _build_completion(model, record['response']['content'], record['response']['finish_reason'], record['usage'])
+
+
+def _stream_completion(model, route, cancelled, **kwargs):
+    """Stream a completion so it can be abandoned between chunks once `cancelled` is set
+    (closing the stream closes the connection and stops generation). Returns the assembled
+    ChatCompletion; if cancelled, the text received so far without usage."""
+    stream = get_openai_client().chat.completions.create(
+        model=model, max_tokens=route['max_tokens'], timeout=route['timeout'],
+        stream=True, stream_options={'include_usage': True}, **kwargs
+    )
+    content, finish_reason, usage, completion_id, created = [], None, None, None, None
+    with stream:
+        for chunk in stream:
+            if cancelled.is_set():
+                return _build_completion(model, ''.join(content), 'length', None, completion_id, created)
+            completion_id, created = chunk.id, chunk.created
+            if chunk.usage:
+                usage = chunk.usage.model_dump()
+            for choice in chunk.choices:
+                if choice.delta.content:
+                    content.append(choice.delta.content)
+                finish_reason = choice.finish_reason or finish_reason
+    return _build_completion(model, ''.join(content), finish_reason, usage, completion_id, created)
+
+
+def _build_completion(model, content, finish_reason, usage, completion_id=None, created=None):
+    return ChatCompletion.model_validate({
+        'id': completion_id or '', 'created': created or int(time.time()), 'model': model,
+        'object': 'chat.completion', 'usage': usage, 'choices': [{
+            'index': 0, 'finish_reason': finish_reason or 'stop',
+            'message': {'role': 'assistant', 'content': content},
+        }],
+    })
 
 
 def generate_cover_page():
@@ -111,13 +243,12 @@ Intake Form:
 Transcript:
 {transcript_text}
 """
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
+    response = chat_completion(
+        section='sections_1_3',
         messages=[
             {"role": "system", "content": "You are a highly skilled psychologist tasked with generating Sections I, II, and III of a Psychological Assessment Report based on provided information. Use markdown formatting for headers and bullet points."},
             {"role": "user", "content": prompt}
         ],
-        max_tokens=1000
     )
     return response.choices[0].message.content
 
@@ -187,13 +318,12 @@ Intake Form:
 Transcript:
 {transcript_text}
 """
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
+    response = chat_completion(
+        section='section_4',
         messages=[
             {"role": "system", "content": "You are a highly skilled psychologist tasked with generating the Background Information section of a Psychological Assessment Report based on provided information."},
             {"role": "user", "content": prompt}
         ],
-        max_tokens=2000
     )
     return response.choices[0].message.content
 
@@ -221,13 +351,12 @@ Use professional language and align with the structure provided.
 
 {test_results_combined}
 """
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
+    response = chat_completion(
+        section='section_5',
         messages=[
             {"role": "system", "content": "You are a highly skilled psychologist tasked with generating the Assessment Measures section of a Psychological Assessment Report based on provided test results. Use markdown formatting for headers and bullet points."},
             {"role": "user", "content": prompt}
         ],
-        max_tokens=3000
     )
     return response.choices[0].message.content
 
@@ -275,13 +404,12 @@ Intake Form:
 Transcript:
 {transcript_text}
 """
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
+    response = chat_completion(
+        section='sections_6_7',
         messages=[
             {"role": "system", "content": "You are a highly skilled psychologist tasked with generating the Behavioral Observations and Mental Status Examination sections of a Psychological Assessment Report based on provided information."},
             {"role": "user", "content": prompt}
         ],
-        max_tokens=2000
     )
     return response.choices[0].message.content
 
@@ -310,13 +438,12 @@ The SRS-2 results suggest generally normal social functioning for Sophie, with a
 Gilliam Autism Rating Scale, Third Edition (GARS-3)
 Sophie's Autism Index score of 84 on the GARS-3 suggests a "very likely" presence of Autism Spectrum Disorder (ASD). She faces significant challenges in social interaction (SI: 7, 16th percentile) and social communication (SC: 6, 9th percentile), but demonstrates strong cognitive skills (CS: 13, 84th percentile). These results underscore the need for comprehensive interventions to address her social and communication challenges while leveraging her cognitive strengths.
 """
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
+    response = chat_completion(
+        section='section_8',
         messages=[
             {"role": "system", "content": "You are a highly skilled psychologist tasked with interpreting assessment results for a Psychological Assessment Report."},
             {"role": "user", "content": prompt}
         ],
-        max_tokens=3000
     )
     return response.choices[0].message.content
 
@@ -385,13 +512,12 @@ Protective Factors:
 
 {all_text_combined}
 """
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
+    response = chat_completion(
+        section='sections_9_11',
         messages=[
             {"role": "system", "content": "You are a highly skilled psychologist tasked with generating DSM-5 Criteria Analysis, Strengths and Challenges, and Risk and Protective Factors sections of a Psychological Assessment Report based on provided information."},
             {"role": "user", "content": prompt}
         ],
-        max_tokens=3000
     )
     return response.choices[0].message.content
 
@@ -456,13 +582,12 @@ Additional Supportive Elements:
 Previous Sections:
 {previous_sections_text}
 """
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
+    response = chat_completion(
+        section='sections_12_14',
         messages=[
             {"role": "system", "content": "You are a highly skilled psychologist tasked with generating Recommendations, Prognosis, and Follow-Up Plan sections of a Psychological Assessment Report based on previous sections."},
             {"role": "user", "content": prompt}
         ],
-        max_tokens=3000
     )
     return response.choices[0].message.content
 
@@ -487,13 +612,12 @@ The follow-up plan includes specific goals to improve social communication, enha
 Previous Sections:
 {previous_sections_text}
 """
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
+    response = chat_completion(
+        section='section_15',
         messages=[
             {"role": "system", "content": "You are a highly skilled psychologist tasked with summarizing a Psychological Assessment Report based on previous sections."},
             {"role": "user", "content": prompt}
         ],
-        max_tokens=2000
     )
     return response.choices[0].message.content
 
@@ -582,111 +706,346 @@ All Files Text:
 Previous Sections:
 {previous_sections_text}
 """
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",
+    response = chat_completion(
+        section='section_16',
         messages=[
             {"role": "system", "content": "You are a highly skilled psychologist tasked with providing the Diagnosis and Resources sections of a Psychological Assessment Report based on all provided information."},
             {"role": "user", "content": prompt}
         ],
-        max_tokens=3000
     )
     return response.choices[0].message.content
 
 
-@shared_task(name='adult_report_generator.generate_full_report')
-def generate_full_report(session_id, s3_paths, user_output_folder, aws_access_key_id, aws_secret_access_key, aws_default_region, s3_bucket):
-    logger.info(f"Starting report generation for session {session_id}")
-    
-    try:
-        # Create S3 client
-        s3_client = get_s3_client(aws_access_key_id, aws_secret_access_key, aws_default_region)
-        
-        logger.info("Downloading and extracting text from S3 files")
-        all_texts = {}
-
-        # Download and extract text from all files directly from S3
-        for filename, s3_key in s3_paths.items():
-            logger.info(f"Processing file: {filename}")
-            try:
-                file_content = download_file_from_s3_to_memory(
-                    s3_key,
-                    aws_access_key_id,
-                    aws_secret_access_key,
-                    aws_default_region,
-                    s3_bucket
-                )
-                if file_content:
-                    file_name = os.path.basename(filename)
-                    all_texts[file_name.split('.')[0]] = extract_text_from_pdf_bytes(file_content)
-                else:
-                    raise Exception(f"Failed to download file from S3: {s3_key}")
-            except Exception as e:
-                logger.error(f"Error processing file {filename}: {str(e)}")
-                raise
+# Each generator takes the extracted texts and the joined text of the independent sections
+SECTION_GENERATORS = {
+    'sections_1_3': lambda texts, previous: generate_sections_1_3(texts.get('IntakeForm_Results', ''), texts.get('Transcript', '')),
+    'section_4': lambda texts, previous: generate_section_4(texts.get('IntakeForm_Results', ''), texts.get('Transcript', '')),
+    'section_5': lambda texts, previous: generate_section_5(texts),
+    'sections_6_7': lambda texts, previous: generate_sections_6_7(texts.get('IntakeForm_Results', ''), texts.get('Transcript', '')),
+    'section_8': lambda texts, previous: generate_section_8(texts),
+    'sections_9_11': lambda texts, previous: generate_sections_9_11(texts),
+    'sections_12_14': lambda texts, previous: generate_sections_12_14(previous),
+    'section_15': lambda texts, previous: generate_section_15(previous),
+    'section_16': lambda texts, previous: generate_section_16(texts, previous),
+}
 
-        # Assign specific texts to variables
-        transcript_text = all_texts.get('Transcript', '')
-        intakeform_text = all_texts.get('IntakeForm_Results', '')
 
-        # Generate report sections
-        generated_sections = {}
-        logger.info("Generating report sections")
-        markdown_content = ""
-        
-        # Define and generate all sections
-        sections = [
-            ('sections_1_3', generate_sections_1_3(intakeform_text, transcript_text)),
-            ('section_4', generate_section_4(intakeform_text, transcript_text)),
-            ('section_5', generate_section_5(all_texts)),
-            ('sections_6_7', generate_sections_6_7(intakeform_text, transcript_text)),
-            ('section_8', generate_section_8(all_texts)),
-            ('sections_9_11', generate_sections_9_11(all_texts)),
-        ]
-
-        for section_name, content in sections:
-            logger.info(f"Generating section: {section_name}")
-            generated_sections[section_name] = content
-            markdown_content += content + "\n\n"
-
-        # Generate remaining sections
-        previous_sections_text = '\n\n'.join(generated_sections.values())
-        remaining_sections = [
-            ('sections_12_14', generate_sections_12_14(previous_sections_text)),
-            ('section_15', generate_section_15(previous_sections_text)),
-            ('section_16', generate_section_16(all_texts, previous_sections_text)),
-        ]
-
-        for section_name, content in remaining_sections:
-            logger.info(f"Generating section: {section_name}")
-            generated_sections[section_name] = content
-            markdown_content += content + "\n\n"
-
-        logger.info("Generating PDFs")
-        # Generate cover page and table of contents
-        cover_content = generate_cover_page()
-        toc_content = generate_table_of_contents()
-        
-        # Use the updated simple_markdown_to_pdf function
+def report_already_generated(s3_client, s3_bucket, s3_report_path):
+    if is_report_marked(s3_report_path):
+        return True
+    try:
+        s3_client.head_object(Bucket=s3_bucket, Key=s3_report_path)
+    except ClientError:
+        return False
+    mark_report_exists(s3_report_path)
+    return True
+
+
+def download_and_extract(progress, s3_paths, aws_access_key_id, aws_secret_access_key, aws_default_region, s3_bucket):
+    """Download every input file from S3 and return the extracted text keyed by file stem."""
+    logger.info("Downloading and extracting text from S3 files")
+    progress.start_stage('download', files=len(s3_paths))
+    s3 = get_s3_client(aws_access_key_id, aws_secret_access_key, aws_default_region)
+    file_contents = {}
+    all_texts = {}
+    flagged = {}
+
+    # Download all files directly from S3
+    for filename, s3_key in s3_paths.items():
+        logger.info(f"Processing file: {filename}")
+        cached_text = read_extracted_text(s3, s3_bucket, filename, s3_key, flagged)
+        if cached_text is not None:
+            logger.info(f"Using previously extracted text of {s3_key}")
+            all_texts[input_name(filename)] = cached_text
+            continue
+        with start_span('s3.get_object', key=s3_key), timed('par_s3_download_duration_seconds'):
+            file_content = download_file_from_s3_to_memory(
+                s3_key,
+                aws_access_key_id,
+                aws_secret_access_key,
+                aws_default_region,
+                s3_bucket
+            )
+        if file_content is None:
+            logger.error(f"Error processing file {filename}: failed to download {s3_key}")
+            raise Exception(f"Failed to download file from S3: {s3_key}")
+        file_contents[filename] = file_content
+        inc('par_input_read_bytes_total', len(file_content), source='pdf')
+        if over_ceiling():
+            # Above the memory ceiling: parse what is held so far now rather than keeping every raw PDF
+            logger.warning(f"Memory ceiling reached while downloading, extracting {len(file_contents)} files early")
+            extract_texts(s3, s3_bucket, file_contents, all_texts, s3_paths, flagged)
+
+    # Extract text, dropping each raw PDF once it has been parsed
+    progress.start_stage('extract', files=len(s3_paths))
+    extract_texts(s3, s3_bucket, file_contents, all_texts, s3_paths, flagged)
+    if flagged:
+        progress.flag('preflight', flagged)
+    progress.end_stage()
+    return all_texts
+
+
+def read_extracted_text(s3, s3_bucket, filename, s3_key, flagged):
+    """Text of an input parsed before, from the Redis blob cache or the input's sidecar
+    (see text_sidecar); None if it has not been parsed yet."""
+    text = get_blob_text(s3_key)
+    if text is not None:
+        return text
+    with start_span('s3.get_object', key=sidecar_key(s3_key)):
+        sidecar = read_sidecar(s3, s3_bucket, s3_key)
+    if sidecar is None:
+        return None
+    flag_input(filename, sidecar['preflight'], flagged)
+    text = join_pages(sidecar['pages'])
+    save_blob_text(s3_key, text)
+    return text
+
+
+def extract_texts(s3, s3_bucket, file_contents, all_texts, s3_paths, flagged):
+    """Move each raw PDF in `file_contents` to its extracted text in `all_texts`, storing
+    the text next to the PDF for later runs."""
+    for filename in list(file_contents):
+        file_content = file_contents.pop(filename)
+        if not file_content:
+            # Blank placeholder for a missing upload
+            all_texts[input_name(filename)] = ''
+            continue
+        try:
+            pages, preflight = extract_pdf_pages(filename, file_content, flagged)
+        except Exception as e:
+            logger.error(f"Error processing file {filename}: {str(e)}")
+            raise
+        s3_key = s3_paths[filename]
+        all_texts[input_name(filename)] = join_pages(pages)
+        with start_span('s3.put_object', key=sidecar_key(s3_key)):
+            write_sidecar(s3, s3_bucket, s3_key, pages, preflight)
+        save_blob_text(s3_key, all_texts[input_name(filename)])
+
+
+def extract_pdf_pages(filename, file_content, flagged):
+    """Per-page text and preflight data of one input PDF. Only the first PDF_MAX_PAGES
+    pages are read."""
+    with start_span('pdf.preflight', file=filename):
+        preflight = preflight_pdf(BytesIO(file_content))
+    flag_input(filename, preflight, flagged)
+    with start_span('pypdf2.extract_text', file=filename, pages=preflight['pages']), timed('par_pdf_extract_duration_seconds'):
+        return extract_pages_from_pdf_bytes(file_content, max_pages=PDF_MAX_PAGES), preflight
+
+
+def flag_input(filename, preflight, flagged):
+    # Files over the preflight limits or without a text layer are recorded in `flagged`
+    problems = limit_problems(preflight)
+    if problems or is_image_only(preflight):
+        logger.warning(f"Input {filename} flagged by preflight: {problems or 'no text layer'}")
+        flagged[input_name(filename)] = {**preflight, 'problems': problems, 'image_only': is_image_only(preflight)}
+
+
+def join_independent_sections(sections):
+    return '\n\n'.join(sections[name] for name in INDEPENDENT_SECTIONS)
+
+
+def generate_report_section(progress, section_name, all_texts, previous_sections_text=None):
+    index = SECTION_NAMES.index(section_name) + 1
+    logger.info(f"Generating section: {section_name}")
+    progress.start_stage(f'section:{section_name}', 'section_started', section=section_name, index=index, total=SECTION_COUNT)
+    all_texts, shed = shed_inputs(all_texts)
+    if shed:
+        logger.warning(f"Truncated inputs of {section_name}: {shed}")
+        progress.flag('inputs_truncated', shed)
+    content = SECTION_GENERATORS[section_name](all_texts, previous_sections_text)
+    progress.end_stage('section_done', section=section_name, index=index, total=SECTION_COUNT)
+    return content
+
+
+def render_and_upload(progress, session_id, sections, aws_access_key_id, aws_secret_access_key, aws_default_region, s3_bucket):
+    """Render all sections to a PDF, upload it and return its S3 key."""
+    markdown_content = ''.join(sections[name] + "\n\n" for name in SECTION_NAMES)
+
+    logger.info("Generating PDFs")
+    progress.start_stage('render')
+    # Generate cover page and table of contents
+    cover_content = generate_cover_page()
+    toc_content = generate_table_of_contents()
+
+    # Use the updated simple_markdown_to_pdf function
+    with start_span('reportlab.build', markdown_chars=len(markdown_content)):
         main_content_pdf = simple_markdown_to_pdf(cover_content, toc_content, markdown_content)
 
-        logger.info("PDF generation completed")
+    logger.info("PDF generation completed")
 
-        # Upload the PDF to S3
-        s3_report_path = f'{session_id}/generated_par.pdf'
-        if upload_bytes_to_s3(
+    # Upload the PDF to S3
+    progress.start_stage('upload')
+    s3_report_path = f'{session_id}/generated_par.pdf'
+    with start_span('s3.put_object', key=s3_report_path, bytes=len(main_content_pdf)):
+        uploaded = upload_bytes_to_s3(
             main_content_pdf,
             s3_report_path,
             aws_access_key_id,
             aws_secret_access_key,
             aws_default_region,
             s3_bucket
-        ):
-            logger.info(f"Report generation completed and uploaded for session {session_id}")
+        )
+    if not uploaded:
+        logger.error(f"Failed to upload generated report to S3 for session {session_id}")
+        raise Exception("Failed to upload generated report to S3")
+    logger.info(f"Report generation completed and uploaded for session {session_id}")
+    mark_report_exists(s3_report_path)
+    return s3_report_path
+
+
+def task_queue(task):
+    return (task.request.delivery_info or {}).get('routing_key')
+
+
+# Single-task pipeline (REPORT_WORKFLOW=single): every stage in one worker process
+
+@shared_task(bind=True, name='adult_report_generator.generate_full_report')
+def generate_full_report(self, session_id, s3_paths, user_output_folder, aws_access_key_id, aws_secret_access_key, aws_default_region, s3_bucket):
+    # Continue the trace started by the web request that enqueued this task
+    with start_span('generate_full_report', traceparent=task_traceparent(self.request), session_id=session_id, task_id=self.request.id):
+        return _generate_full_report(self, session_id, s3_paths, user_output_folder, aws_access_key_id, aws_secret_access_key, aws_default_region, s3_bucket)
+
+
+def _generate_full_report(task, session_id, s3_paths, user_output_folder, aws_access_key_id, aws_secret_access_key, aws_default_region, s3_bucket):
+    logger.info(f"Starting report generation for session {session_id}")
+    progress = ReportProgress(session_id, REPORT_STAGES, task=task, queue=task_queue(task))
+    
+    try:
+        # Create S3 client
+        s3_client = get_s3_client(aws_access_key_id, aws_secret_access_key, aws_default_region)
+
+        # Tasks are acked late and may be redelivered after a worker dies; never redo a finished report
+        s3_report_path = f'{session_id}/generated_par.pdf'
+        if report_already_generated(s3_client, s3_bucket, s3_report_path):
+            logger.info(f"Report for session {session_id} already exists, skipping regeneration")
+            progress.complete(s3_path=s3_report_path)
             return {'status': 'success', 's3_path': s3_report_path}
-        else:
-            logger.error(f"Failed to upload generated report to S3 for session {session_id}")
-            raise Exception("Failed to upload generated report to S3")
+
+        all_texts = download_and_extract(progress, s3_paths, aws_access_key_id, aws_secret_access_key, aws_default_region, s3_bucket)
+
+        # Generate report sections
+        logger.info("Generating report sections")
+        generated_sections = {}
+        for section_name in INDEPENDENT_SECTIONS:
+            generated_sections[section_name] = generate_report_section(progress, section_name, all_texts)
+
+        # Generate remaining sections
+        previous_sections_text = join_independent_sections(generated_sections)
+        for section_name in DEPENDENT_SECTIONS:
+            generated_sections[section_name] = generate_report_section(progress, section_name, all_texts, previous_sections_text)
+
+        s3_report_path = render_and_upload(progress, session_id, generated_sections, aws_access_key_id, aws_secret_access_key, aws_default_region, s3_bucket)
+        progress.complete(s3_path=s3_report_path)
+        return {'status': 'success', 's3_path': s3_report_path}
 
     except Exception as e:
         logger.error(f"An error occurred during report generation: {e}")
-        return {'status': 'error', 'message': str(e)}
\ No newline at end of file
+        progress.fail(str(e))
+        return {'status': 'error', 'message': str(e)}
+
+
+# Stage-split pipeline (REPORT_WORKFLOW=canvas, see report_workflow): each stage is its own
+# task so it can run on a pool sized for it. Stages raise on error so the chain stops and
+# report_failed runs; each one is safe to redeliver.
+
+@shared_task(bind=True, name='adult_report_generator.extract_report_inputs',
+             soft_time_limit=config.EXTRACT_TIME_LIMIT, time_limit=config.EXTRACT_TIME_LIMIT + 60)
+def extract_report_inputs(self, session_id, s3_paths, aws_access_key_id, aws_secret_access_key, aws_default_region, s3_bucket):
+    with start_span('extract_report_inputs', traceparent=task_traceparent(self.request), session_id=session_id, task_id=self.request.id):
+        logger.info(f"Starting report generation for session {session_id}")
+        progress = ReportProgress(session_id, WORKFLOW_STAGES, task=self, queue=task_queue(self))
+        all_texts = download_and_extract(progress, s3_paths, aws_access_key_id, aws_secret_access_key, aws_default_region, s3_bucket)
+        save_texts(session_id, all_texts)
+        progress.detach()
+        return session_id
+
+
+@shared_task(bind=True, name='adult_report_generator.extract_input_file',
+             soft_time_limit=config.EXTRACT_TIME_LIMIT, time_limit=config.EXTRACT_TIME_LIMIT + 60)
+def extract_input_file(self, session_id, filename, s3_key, aws_access_key_id, aws_secret_access_key, aws_default_region, s3_bucket):
+    # Pipelined workflow: sent by the web process as soon as this file is in S3
+    with start_span('extract_input_file', traceparent=task_traceparent(self.request), session_id=session_id, file=filename):
+        name = input_name(filename)
+        # Another file of the report already failed; report_failed has cleared its state
+        if has_failed(session_id):
+            logger.info(f"Report {session_id} already failed, skipping extraction of {filename}")
+            return name
+        progress = ReportProgress(session_id, STAGE_PLANS['pipelined'], task=self, queue=task_queue(self))
+        progress.start_stage(f'extract:{name}', 'extract', file=name)
+        s3 = get_s3_client(aws_access_key_id, aws_secret_access_key, aws_default_region)
+        flagged = {}
+        text = read_extracted_text(s3, s3_bucket, filename, s3_key, flagged)
+        if text is None:
+            with start_span('s3.get_object', key=s3_key), timed('par_s3_download_duration_seconds'):
+                file_content = download_file_from_s3_to_memory(s3_key, aws_access_key_id, aws_secret_access_key, aws_default_region, s3_bucket)
+            if file_content is None:
+                raise Exception(f"Failed to download file from S3: {s3_key}")
+            inc('par_input_read_bytes_total', len(file_content), source='pdf')
+            texts = {}
+            extract_texts(s3, s3_bucket, {filename: file_content}, texts, {filename: s3_key}, flagged)
+            text = texts[name]
+        if flagged:
+            progress.flag('preflight', flagged)
+        save_text(session_id, name, text)
+        progress.detach()
+        fire_ready_gates(self.app, session_id)
+        return name
+
+
+@shared_task(bind=True, name='adult_report_generator.generate_section_task',
+             soft_time_limit=config.SECTION_TIME_LIMIT, time_limit=config.SECTION_TIME_LIMIT + 60)
+def generate_section_task(self, session_id, section_name, workflow='canvas'):
+    with start_span('generate_section_task', traceparent=task_traceparent(self.request), session_id=session_id, section=section_name):
+        if has_failed(session_id):
+            logger.info(f"Report {session_id} already failed, skipping section {section_name}")
+            return section_name
+        sections = load_sections(session_id)
+        if section_name not in sections:
+            previous_sections_text = join_independent_sections(sections) if section_name in DEPENDENT_SECTIONS else None
+            progress = ReportProgress(session_id, STAGE_PLANS[workflow], task=self)
+            content = generate_report_section(progress, section_name, load_texts(session_id), previous_sections_text)
+            save_section(session_id, section_name, content)
+            progress.detach()
+        else:
+            logger.info(f"Section {section_name} for session {session_id} already generated")
+        if workflow == 'pipelined':
+            fire_ready_gates(self.app, session_id)
+        return section_name
+
+
+@shared_task(name='adult_report_generator.collect_sections')
+def collect_sections(section_names, session_id):
+    # Barrier between the independent and the dependent sections
+    return section_names
+
+
+@shared_task(bind=True, name='adult_report_generator.render_and_upload_report',
+             soft_time_limit=config.RENDER_TIME_LIMIT, time_limit=config.RENDER_TIME_LIMIT + 60)
+def render_and_upload_report(self, section_names, session_id, aws_access_key_id, aws_secret_access_key, aws_default_region, s3_bucket, workflow='canvas'):
+    with start_span('render_and_upload_report', traceparent=task_traceparent(self.request), session_id=session_id, task_id=self.request.id):
+        progress = ReportProgress(session_id, STAGE_PLANS[workflow], task=self)
+        s3_client = get_s3_client(aws_access_key_id, aws_secret_access_key, aws_default_region)
+        s3_report_path = f'{session_id}/generated_par.pdf'
+        if not report_already_generated(s3_client, s3_bucket, s3_report_path):
+            sections = load_sections(session_id)
+            missing = [name for name in SECTION_NAMES if name not in sections]
+            if missing:
+                raise Exception(f"Missing generated sections: {', '.join(missing)}")
+            s3_report_path = render_and_upload(progress, session_id, sections, aws_access_key_id, aws_secret_access_key, aws_default_region, s3_bucket)
+        progress.complete(s3_path=s3_report_path)
+        clear_report_state(session_id)
+        return {'status': 'success', 's3_path': s3_report_path}
+
+
+@shared_task(name='adult_report_generator.report_failed')
+def report_failed(request, exc, traceback, session_id):
+    # Errback of the canvas: may run once per failed stage, so only report the first failure
+    status = get_status(session_id) or {}
+    if status.get('state') == 'FAILURE':
+        return
+    logger.error(f"An error occurred during report generation for session {session_id}: {exc}")
+    status.update({'state': 'FAILURE', 'message': str(exc), 'failed_task': request.task, 'updated_at': time.time()})
+    set_status(session_id, status)
+    publish_progress(session_id, 'error', message=str(exc))
+    inc('par_reports_total', status='error')
+    clear_report_state(session_id)
@@ -1,258 +1,445 @@
 import os
 import uuid
 from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, session, send_file, make_response
+import json
+import time
+from flask import Flask, current_app, render_template, request, redirect, url_for, session, Response, stream_with_context, jsonify, g
 from werkzeug.utils import secure_filename
-from s3_utils import download_file_from_s3, upload_blank_file_to_s3
+from s3_utils import get_s3_client, upload_blank_file_to_s3
 from utils import allowed_file
-import logging
-from logging.handlers import RotatingFileHandler
-from celery_config import make_celery
+from flask.logging import default_handler
+from logging_config import configure_logging
+from celery_config import get_celery, INTERACTIVE_QUEUE, BULK_QUEUE, REPORT_QUEUES
+from report_workflow import INPUT_FILES, build_report_workflow, build_pipelined_workflow, extract_file_signature
+from report_state import clear_report_state
+from blob_store import store_blob
+from pdf_preflight import PreflightError, preflight_pdf, limit_problems, needs_slow_path
 from dotenv import load_dotenv
-import boto3
-from botocore.exceptions import NoCredentialsError
+from botocore.exceptions import NoCredentialsError, ClientError
 from config import Config
-from celery import shared_task
+from progress import stream_progress, mark_queued, get_status
+from metrics import render_metrics, render_queue_depth
+from tracing import begin_span, end_span, start_span, current_span
+from report_cache import PRESIGNED_URL_EXPIRY, is_report_marked, mark_report_exists, get_cached_report_url, cache_report_url
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Initialize Flask app
-app = Flask(__name__)
-
-# Configure the app with settings from Config
-app.config.from_object(Config)
-
-# Add Celery configuration
-app.config.update(
-    CELERY_BROKER_URL=os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379'),
-    CELERY_RESULT_BACKEND=os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379')
-)
-
-# Ensure AWS configuration is loaded
-app.config['AWS_ACCESS_KEY_ID'] = os.getenv('AWS_ACCESS_KEY_ID')
-app.config['AWS_SECRET_ACCESS_KEY'] = os.getenv('AWS_SECRET_ACCESS_KEY')
-app.config['AWS_DEFAULT_REGION'] = os.getenv('AWS_DEFAULT_REGION')
-app.config['S3_BUCKET'] = os.getenv('S3_BUCKET')
-
-# Initialize Celery with the Flask app
-celery = make_celery(app)
-
-# Import the task after initializing Celery
-from adult_report_generator import generate_full_report
-
-# Set up logging
-log_folder = os.path.dirname(os.path.abspath(__file__))
-log_file_path = os.path.join(log_folder, 'app.log')
-file_handler = RotatingFileHandler(log_file_path, maxBytes=10240, backupCount=10)
-file_handler.setFormatter(logging.Formatter(
-    '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'
-))
-file_handler.setLevel(logging.INFO)
-app.logger.addHandler(file_handler)
-app.logger.setLevel(logging.INFO)
-app.logger.info('PAR application startup')
-
-# Initialize S3 client with AWS credentials from environment variables
-s3 = boto3.client(
-    's3',
-    aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-    aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-    region_name=os.getenv('AWS_DEFAULT_REGION')
-)
-
-# Ensure the upload and output folders exist
-upload_folder = os.getenv('UPLOAD_FOLDER', './uploads')
-output_folder = os.getenv('OUTPUT_FOLDER', './outputs')
-os.makedirs(upload_folder, exist_ok=True)
-os.makedirs(output_folder, exist_ok=True)
+GENERATE_FULL_REPORT_TASK = 'adult_report_generator.generate_full_report'
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+
+REQUIRED_FILES = set(INPUT_FILES)
+
+
+def create_app():
+    """Application factory. Nothing expensive happens here: the S3 client, Celery app and
+    Redis connection are created on first use and cached per process."""
+    app = Flask(__name__)
+
+    # Configure the app with settings from Config
+    app.config.from_object(Config)
+
+    # Ensure AWS configuration is loaded
+    app.config['AWS_ACCESS_KEY_ID'] = os.getenv('AWS_ACCESS_KEY_ID')
+    app.config['AWS_SECRET_ACCESS_KEY'] = os.getenv('AWS_SECRET_ACCESS_KEY')
+    app.config['AWS_DEFAULT_REGION'] = os.getenv('AWS_DEFAULT_REGION')
+    app.config['S3_BUCKET'] = os.getenv('S3_BUCKET')
+
+    # Set up logging (records are written by a background thread, see logging_config)
+    log_folder = os.path.dirname(os.path.abspath(__file__))
+    log_file_path = os.path.join(log_folder, 'app.log')
+    app.logger.removeHandler(default_handler)
+    configure_logging(app.logger, log_file_path)
+
+    # Ensure the upload and output folders exist
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+    os.makedirs(app.config['OUTPUT_FOLDER'], exist_ok=True)
+
+    app.before_request(start_request_span)
+    app.teardown_request(end_request_span)
+    register_routes(app)
+
+    app.logger.info('PAR application startup')
+    return app
+
+
+def register_routes(app):
+    app.add_url_rule('/', view_func=index, methods=['GET', 'POST'])
+    app.add_url_rule('/processing', view_func=processing)
+    app.add_url_rule('/status', view_func=status)
+    app.add_url_rule('/status/<task_id>', view_func=task_status)
+    app.add_url_rule('/progress_stream', view_func=progress_stream)
+    app.add_url_rule('/results', view_func=results)
+    app.add_url_rule('/download_file', view_func=download_file)
+    app.add_url_rule('/metrics', view_func=metrics)
+    app.add_url_rule('/test_s3', view_func=test_s3)
+
+
+def get_s3():
+    return get_s3_client(
+        current_app.config['AWS_ACCESS_KEY_ID'],
+        current_app.config['AWS_SECRET_ACCESS_KEY'],
+        current_app.config['AWS_DEFAULT_REGION']
+    )
+
+
+def start_input_extraction(queue, session_id, filename, s3_key, slow=False):
+    # Pipelined workflow: extraction of each file starts as soon as it is in S3
+    with start_span('celery.enqueue', task='extract_input_file', session_id=session_id, file=filename, slow=slow):
+        extract_file_signature(
+            get_celery(),
+            queue,
+            session_id,
+            filename,
+            s3_key,
+            current_app.config['AWS_ACCESS_KEY_ID'],
+            current_app.config['AWS_SECRET_ACCESS_KEY'],
+            current_app.config['AWS_DEFAULT_REGION'],
+            current_app.config['S3_BUCKET'],
+            slow=slow
+        ).apply_async()
+
+
+# Tracing: one span per request, parent of every S3 call and the Celery enqueue
+def start_request_span():
+    g.trace_span, g.trace_token = begin_span(
+        f"{request.method} {request.path}",
+        traceparent=request.headers.get('traceparent'),
+        **{'http.method': request.method, 'http.route': request.path}
+    )
+
+def end_request_span(error=None):
+    if getattr(g, 'trace_span', None) is not None:
+        end_span(g.trace_span, g.trace_token, error=error)
+        g.trace_span = None
 
 
 # Routes
-@app.route('/', methods=['GET', 'POST'])
 def index():
-    app.logger.info("Index route accessed")
+    current_app.logger.info("Index route accessed")
     if request.method == 'POST':
-        app.logger.info("POST request received")
+        current_app.logger.info("POST request received")
         session_id = str(uuid.uuid4())
-        app.logger.info(f"Generated session ID: {session_id}")
+        current_app.logger.info(f"Generated session ID: {session_id}")
         session['id'] = session_id
+        current_span().set_attribute('session_id', session_id)
 
         s3_folder = f"uploads/{session_id}/"
-        user_output_folder = os.path.join(output_folder, session_id)
-        app.logger.info(f"Created S3 folder: {s3_folder}, output folder: {user_output_folder}")
+        # Passed to generate_full_report for compatibility only; nothing is written locally
+        user_output_folder = os.path.join(current_app.config['OUTPUT_FOLDER'], session_id)
 
-        os.makedirs(user_output_folder, exist_ok=True)
-
-        required_files = {
-            'Transcript.pdf', 'IntakeForm_Results.pdf', 'CATQ_Results.pdf',
-            'GAD_Results.pdf', 'GARS_Results.pdf', 'KBIT_Results.pdf',
-            'RAADSR_Results.pdf', 'SRS2_Results.pdf', 'Vineland_Results.pdf'
-        }
+        # Scripted backlog submissions can opt into the bulk queue so they never
+        # delay a clinician waiting on the processing page
+        queue = BULK_QUEUE if request.form.get('priority') == 'bulk' else INTERACTIVE_QUEUE
+        pipelined = current_app.config['REPORT_WORKFLOW'] == 'pipelined'
 
+        s3 = get_s3()
         uploaded_files = request.files.getlist('assessment_files')
         uploaded_filenames = set()
         s3_paths = {}
 
+        # Check every file before anything is stored, so a rejected upload leaves nothing behind.
+        # Page count and text layer come from the page tree only (see pdf_preflight).
+        checked_files = []
         for file in uploaded_files:
-            if file and allowed_file(file.filename):
-                filename = secure_filename(file.filename)
-                s3_key = s3_folder + filename
-                try:
-                    s3.upload_fileobj(file, os.getenv('S3_BUCKET'), s3_key)
-                    uploaded_filenames.add(filename)
-                    s3_paths[filename] = s3_key
-                    app.logger.info(f"Uploaded file to S3: {s3_key}")
-                    
-                    # Verify the upload
-                    s3.head_object(Bucket=os.getenv('S3_BUCKET'), Key=s3_key)
-                    app.logger.info(f"Verified file exists in S3: {s3_key}")
-                except NoCredentialsError:
-                    app.logger.error("S3 credentials not available")
-                    return "S3 credentials not available", 500
-                except Exception as e:
-                    app.logger.error(f"Error uploading file to S3: {str(e)}")
-                    app.logger.error(f"Bucket: {os.getenv('S3_BUCKET')}")
-                    app.logger.error(f"Key: {s3_key}")
-                    app.logger.error(f"File object type: {type(file)}")
-                    return f"Error uploading file to S3: {str(e)}", 500
-            else:
-                app.logger.error(f"Invalid file: {file.filename}")
+            if not (file and allowed_file(file.filename)):
+                current_app.logger.error(f"Invalid file: {file.filename}")
                 return f"Invalid file: {file.filename}", 400
+            filename = secure_filename(file.filename)
+            try:
+                with start_span('pdf.preflight', file=filename):
+                    preflight = preflight_pdf(file.stream)
+                problems = limit_problems(preflight)
+            except PreflightError as e:
+                problems = [str(e)]
+            if problems:
+                current_app.logger.error(f"Rejected file {filename}: {'; '.join(problems)}")
+                return f"Invalid file {filename}: {'; '.join(problems)}", 400
+            checked_files.append((file, filename, preflight))
+
+        if pipelined:
+            # Built only once every file passed the checks, so a rejected batch leaves no queued
+            # state or gates behind. Work starts with the first upload, so it is queued from now on
+            try:
+                mark_queued(session_id, queue)
+                with start_span('report_workflow.build', session_id=session_id, queue=queue):
+                    render_task_id = build_pipelined_workflow(
+                        get_celery(),
+                        queue,
+                        session_id,
+                        current_app.config['AWS_ACCESS_KEY_ID'],
+                        current_app.config['AWS_SECRET_ACCESS_KEY'],
+                        current_app.config['AWS_DEFAULT_REGION'],
+                        current_app.config['S3_BUCKET']
+                    )
+            except Exception as e:
+                current_app.logger.error(f"Error preparing report workflow: {str(e)}")
+                return render_template('error.html', error_message="An error occurred while processing your request. Please try again later."), 500
+
+        for file, filename, preflight in checked_files:
+            s3_key = s3_folder + filename
+            try:
+                # Stored by content hash: a file submitted before is not uploaded again
+                with start_span('blob.store', file=filename):
+                    s3_key, reused = store_blob(s3, os.getenv('S3_BUCKET'), file.stream)
+                uploaded_filenames.add(filename)
+                s3_paths[filename] = s3_key
+                if reused:
+                    current_app.logger.info(f"File {filename} already stored as {s3_key}, skipped upload")
+                else:
+                    current_app.logger.info(f"Uploaded file to S3: {s3_key}")
+                if pipelined:
+                    slow = needs_slow_path(preflight)
+                    if slow:
+                        current_app.logger.info(f"Extracting {filename} on the slow queue: {preflight}")
+                    start_input_extraction(queue, session_id, filename, s3_key, slow=slow)
+            except NoCredentialsError:
+                current_app.logger.error("S3 credentials not available")
+                if pipelined:
+                    clear_report_state(session_id)
+                return "S3 credentials not available", 500
+            except Exception as e:
+                if pipelined:
+                    # Drop the pending steps so no sections are generated for this upload
+                    clear_report_state(session_id)
+                current_app.logger.error(f"Error uploading file to S3: {str(e)}")
+                current_app.logger.error(f"Bucket: {os.getenv('S3_BUCKET')}")
+                current_app.logger.error(f"Key: {s3_key}")
+                current_app.logger.error(f"File object type: {type(file)}")
+                return f"Error uploading file to S3: {str(e)}", 500
 
         # Handle missing files
-        missing_files = required_files - uploaded_filenames
+        missing_files = REQUIRED_FILES - uploaded_filenames
         for missing_file in missing_files:
-            s3_path = upload_blank_file_to_s3(
-                missing_file, 
-                session_id, 
-                app.config['AWS_ACCESS_KEY_ID'],
-                app.config['AWS_SECRET_ACCESS_KEY'],
-                app.config['AWS_DEFAULT_REGION'],
-                app.config['S3_BUCKET']
-            )
+            with start_span('s3.put_object', file=missing_file, blank=True):
+                s3_path = upload_blank_file_to_s3(
+                    missing_file, 
+                    session_id, 
+                    current_app.config['AWS_ACCESS_KEY_ID'],
+                    current_app.config['AWS_SECRET_ACCESS_KEY'],
+                    current_app.config['AWS_DEFAULT_REGION'],
+                    current_app.config['S3_BUCKET']
+                )
             if s3_path:
                 s3_paths[missing_file] = s3_path
+                if pipelined:
+                    start_input_extraction(queue, session_id, missing_file, s3_path)
             else:
-                app.logger.error(f"Failed to create blank file for: {missing_file}")
+                current_app.logger.error(f"Failed to create blank file for: {missing_file}")
+                if pipelined:
+                    clear_report_state(session_id)
                 return f"Failed to create blank file for: {missing_file}", 500
 
-        app.logger.info("Enqueuing background task")
+        if pipelined:
+            # Everything else is started by the extraction tasks; the render task carries the result
+            session['task_id'] = render_task_id
+            current_app.logger.info(f"Pipelined report {session_id} started on queue {queue}, result task {render_task_id}")
+            return redirect(url_for('processing'))
+
+        current_app.logger.info("Enqueuing background task")
         try:
-            task = generate_full_report.delay(
-                session_id, 
-                s3_paths, 
-                user_output_folder,
-                app.config['AWS_ACCESS_KEY_ID'],
-                app.config['AWS_SECRET_ACCESS_KEY'],
-                app.config['AWS_DEFAULT_REGION'],
-                app.config['S3_BUCKET']
-            )
+            mark_queued(session_id, queue)
+            # The traceparent of this span is added to the task headers on publish
+            with start_span('celery.enqueue', task='generate_full_report', session_id=session_id, queue=queue):
+                # Sent by name so the web process never imports the report generator
+                if current_app.config['REPORT_WORKFLOW'] == 'canvas':
+                    # The id of the last task in the chain is the one that carries the result
+                    task = build_report_workflow(
+                        get_celery(),
+                        queue,
+                        session_id,
+                        s3_paths,
+                        current_app.config['AWS_ACCESS_KEY_ID'],
+                        current_app.config['AWS_SECRET_ACCESS_KEY'],
+                        current_app.config['AWS_DEFAULT_REGION'],
+                        current_app.config['S3_BUCKET']
+                    ).apply_async()
+                else:
+                    task = get_celery().send_task(GENERATE_FULL_REPORT_TASK, queue=queue, args=[
+                        session_id, 
+                        s3_paths, 
+                        user_output_folder,
+                        current_app.config['AWS_ACCESS_KEY_ID'],
+                        current_app.config['AWS_SECRET_ACCESS_KEY'],
+                        current_app.config['AWS_DEFAULT_REGION'],
+                        current_app.config['S3_BUCKET']
+                    ])
             session['task_id'] = task.id
-            app.logger.info(f"Background task enqueued with ID: {task.id}")
+            current_app.logger.info(f"Background task enqueued with ID: {task.id} on queue {queue}")
             return redirect(url_for('processing'))
         except Exception as e:
-            app.logger.error(f"Error enqueuing background task: {str(e)}")
+            current_app.logger.error(f"Error enqueuing background task: {str(e)}")
             return render_template('error.html', error_message="An error occurred while processing your request. Please try again later."), 500
 
     else:
-        app.logger.info("Rendering index page")
+        current_app.logger.info("Rendering index page")
         return render_template('index.html', current_year=datetime.now().year)
 
-@app.route('/processing')
 def processing():
-    app.logger.info("Processing route accessed")
+    current_app.logger.info("Processing route accessed")
     task_id = session.get('task_id')
     if not task_id:
-        app.logger.warning("No task ID found in session, redirecting to index")
+        current_app.logger.warning("No task ID found in session, redirecting to index")
         return redirect(url_for('index'))
 
-    task = generate_full_report.AsyncResult(task_id)
-    app.logger.info(f"Task state: {task.state}")
-    if task.state == 'PENDING':
-        app.logger.info(f"Task {task_id} is still pending")
+    task = get_celery().AsyncResult(task_id)
+    current_app.logger.info(f"Task state: {task.state}")
+    # With the stage-split workflow the tracked task is the last one in the chain and stays
+    # PENDING if an earlier stage fails; the failure is recorded in the status snapshot
+    snapshot = get_status(session.get('id')) or {}
+    if task.state == 'PENDING' and snapshot.get('state') == 'FAILURE':
+        current_app.logger.error(f"Task {task_id} failed in an earlier stage: {snapshot.get('message')}")
+        return "Task failed", 500
+    if task.state in ['PENDING', 'STARTED', 'PROGRESS', 'RETRY']:
+        current_app.logger.info(f"Task {task_id} is still {task.state.lower()}")
         return render_template('processing.html')
     elif task.state in ['FAILURE', 'REVOKED']:
-        app.logger.error(f"Task {task_id} failed: {str(task.result)}")
+        current_app.logger.error(f"Task {task_id} failed: {str(task.result)}")
         return "Task failed", 500
     elif task.state == 'SUCCESS':
-        app.logger.info(f"Task {task_id} completed successfully")
+        current_app.logger.info(f"Task {task_id} completed successfully")
         result = task.result
         if isinstance(result, dict) and 'status' in result:
             if result['status'] == 'success':
-                app.logger.info("Redirecting to results")
+                current_app.logger.info("Redirecting to results")
                 session['s3_report_path'] = result['s3_path']
                 return redirect(url_for('results'))
             else:
-                app.logger.error(f"Task completed with error: {result.get('message', 'Unknown error')}")
+                current_app.logger.error(f"Task completed with error: {result.get('message', 'Unknown error')}")
                 return "Task failed", 500
         else:
-            app.logger.error(f"Unexpected task result: {result}")
+            current_app.logger.error(f"Unexpected task result: {result}")
             return "Unexpected task result", 500
     else:
-        app.logger.info(f"Task {task_id} in unknown state: {task.state}")
+        current_app.logger.info(f"Task {task_id} in unknown state: {task.state}")
         return "Task status unknown", 500
     
-@app.route('/results')
+def build_status(task_id, session_id=None):
+    task = get_celery().AsyncResult(task_id)
+    info = task.info if isinstance(task.info, dict) else {}
+    session_id = session_id or info.get('session_id')
+    status = (get_status(session_id) if session_id else None) or dict(info)
+
+    # Celery's state is authoritative once the task has finished; before that the
+    # snapshot is more detailed (it knows QUEUED, which Celery reports as PENDING)
+    if task.state in ['FAILURE', 'REVOKED']:
+        status['state'] = 'FAILURE'
+    elif task.state == 'SUCCESS':
+        succeeded = isinstance(task.result, dict) and task.result.get('status') == 'success'
+        status['state'] = 'SUCCESS' if succeeded else 'FAILURE'
+    elif status.get('state') in [None, 'QUEUED'] and task.state != 'PENDING':
+        status['state'] = task.state
+    else:
+        status.setdefault('state', task.state)
+
+    status['task_id'] = task_id
+    status['celery_state'] = task.state
+    if status['state'] == 'QUEUED' and status.get('enqueued_at'):
+        status['queued_for'] = round(time.time() - status['enqueued_at'], 1)
+    return status
+
+def status():
+    task_id = session.get('task_id')
+    if not task_id:
+        return jsonify({'error': 'No report in progress'}), 404
+    return jsonify(build_status(task_id, session.get('id')))
+
+def task_status(task_id):
+    return jsonify(build_status(task_id))
+
+def progress_stream():
+    session_id = session.get('id')
+    if not session_id or not session.get('task_id'):
+        current_app.logger.warning("No task ID found in session for progress stream")
+        return "No report in progress", 404
+
+    # Sent by EventSource when it reconnects: resume after the last event the page has
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    last_seq = int(last_event_id) if last_event_id.isdigit() else 0
+
+    def generate():
+        # The stream is closed on timeout; ask the browser to reconnect quickly
+        yield "retry: 2000\n\n"
+        for event in stream_progress(session_id, timeout=current_app.config['PROGRESS_STREAM_TIMEOUT'], last_seq=last_seq):
+            if event is None:
+                yield ": keepalive\n\n"
+            else:
+                yield f"id: {event['seq']}\nevent: {event['event']}\ndata: {json.dumps(event)}\n\n"
+
+    response = Response(stream_with_context(generate()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
 def results():
-    app.logger.info("Results route accessed")
+    current_app.logger.info("Results route accessed")
     s3_report_path = session.get('s3_report_path')
     if not s3_report_path:
-        app.logger.warning("No S3 report path found in session, redirecting to processing")
+        current_app.logger.warning("No S3 report path found in session, redirecting to processing")
         return redirect(url_for('processing'))
 
+    presigned_url = get_cached_report_url(s3_report_path)
+    if presigned_url:
+        current_app.logger.info("Using cached report URL, rendering results page")
+        return render_template('results.html', download_url=presigned_url, current_year=datetime.now().year)
+
+    s3 = get_s3()
     try:
-        s3.head_object(Bucket=os.getenv('S3_BUCKET'), Key=s3_report_path)
-        app.logger.info("Report found in S3, rendering results page")
+        # The task marks the report as existing once its upload succeeds; only fall back to S3 otherwise
+        if not is_report_marked(s3_report_path):
+            with start_span('s3.head_object', key=s3_report_path):
+                s3.head_object(Bucket=os.getenv('S3_BUCKET'), Key=s3_report_path)
+            mark_report_exists(s3_report_path)
+        current_app.logger.info("Report found, rendering results page")
         presigned_url = s3.generate_presigned_url(
             'get_object',
             Params={'Bucket': os.getenv('S3_BUCKET'), 'Key': s3_report_path},
-            ExpiresIn=3600  # URL valid for 1 hour
+            ExpiresIn=PRESIGNED_URL_EXPIRY
         )
+        cache_report_url(s3_report_path, presigned_url, PRESIGNED_URL_EXPIRY)
         return render_template('results.html', download_url=presigned_url, current_year=datetime.now().year)
-    except s3.exceptions.ClientError as e:
+    except ClientError as e:
         if e.response['Error']['Code'] == "404":
-            app.logger.warning("Report not found in S3, redirecting to processing")
+            current_app.logger.warning("Report not found in S3, redirecting to processing")
             return redirect(url_for('processing'))
         else:
-            app.logger.error(f"Error checking S3 for report: {e}")
+            current_app.logger.error(f"Error checking S3 for report: {e}")
             return "An error occurred", 500
 
-@app.route('/download_file')
 def download_file():
     session_id = session.get('id')
     file_path = f"{session_id}/generated_par.pdf"
 
     try:
-        local_path = '/tmp/generated_par.pdf'
-        download_file_from_s3(
-            file_path, 
-            local_path,
-            app.config['AWS_ACCESS_KEY_ID'],
-            app.config['AWS_SECRET_ACCESS_KEY'],
-            app.config['AWS_DEFAULT_REGION'],
-            app.config['S3_BUCKET']
-        )
-        
-        with open(local_path, 'rb') as f:
-            response = make_response(f.read())
-        
-        response.headers['Content-Type'] = 'application/pdf'
-        response.headers['Content-Disposition'] = 'attachment; filename=generated_par.pdf'
-        
-        return response
+        # Stream the report straight from S3 rather than staging it in a shared temp file:
+        # concurrent downloads no longer overwrite each other, and under async workers the
+        # request only holds a connection while chunks are in flight
+        with start_span('s3.get_object', key=file_path):
+            s3_object = get_s3().get_object(Bucket=current_app.config['S3_BUCKET'], Key=file_path)
     except Exception as e:
-        app.logger.error(f"Error downloading file: {str(e)}")
+        current_app.logger.error(f"Error downloading file: {str(e)}")
         return "Error downloading file", 500
 
-@app.route('/test_s3')
+    response = Response(s3_object['Body'].iter_chunks(DOWNLOAD_CHUNK_SIZE), mimetype='application/pdf')
+    response.headers['Content-Length'] = s3_object['ContentLength']
+    response.headers['Content-Disposition'] = 'attachment; filename=generated_par.pdf'
+    return response
+
+def metrics():
+    try:
+        return Response(render_metrics() + render_queue_depth(REPORT_QUEUES), mimetype='text/plain; version=0.0.4')
+    except Exception as e:
+        current_app.logger.error(f"Error rendering metrics: {str(e)}")
+        return "Error rendering metrics", 500
+
 def test_s3():
     try:
-        s3.list_buckets()
+        get_s3().list_buckets()
         return "Successfully connected to S3 and listed buckets", 200
     except Exception as e:
-        app.logger.error(f"Error connecting to S3: {str(e)}")
+        current_app.logger.error(f"Error connecting to S3: {str(e)}")
         return f"Error connecting to S3: {str(e)}", 500
 
 if __name__ == "__main__":
+    app = create_app()
     app.run(debug=app.config['DEBUG'], port=5000)
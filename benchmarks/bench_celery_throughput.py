@@ -0,0 +1,101 @@
+"""Throughput per worker process under different Celery execution settings.
+
+Starts real workers against the local Redis broker and feeds them simulated report
+tasks: a little CPU work followed by a long wait, like a section waiting on the LLM.
+Task durations vary, which is what makes prefetching hurt.
+
+    python -m benchmarks.bench_celery_throughput [--tasks 40] [--workers 2] [--profiles default tuned threads]
+
+Requires a Redis server at CELERY_BROKER_URL; the gevent profile requires gevent.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import subprocess
+from celery import Celery
+from celery_config import CELERY_BROKER_URL, CELERY_RESULT_BACKEND, apply_execution_profile
+
+# name -> (pool, concurrency per worker, prefetch multiplier, acks_late, worker options)
+PROFILES = {
+    # Celery defaults: prefork, prefetch 4, ack on receipt
+    'default': ('prefork', 4, 4, False, []),
+    # The production profile from celery_config, started with the Procfile's options
+    'tuned': ('prefork', 4, 1, True, ['-O', 'fair']),
+    'threads': ('threads', 16, 1, True, ['-O', 'fair']),
+    'gevent': ('gevent', 50, 1, True, ['-O', 'fair']),
+}
+
+PROFILE = os.getenv('BENCH_PROFILE', 'tuned')
+QUEUE = f"bench_{PROFILE}"
+
+app = Celery('par_bench', broker=CELERY_BROKER_URL, backend=CELERY_RESULT_BACKEND)
+_pool, _concurrency, _prefetch, _acks_late, _ = PROFILES[PROFILE]
+apply_execution_profile(app, pool=_pool, concurrency=_concurrency, prefetch_multiplier=_prefetch)
+app.conf.task_acks_late = _acks_late
+app.conf.task_default_queue = QUEUE
+
+
+@app.task(name='bench.simulated_report')
+def simulated_report(cpu_seconds, io_seconds):
+    end = time.perf_counter() + cpu_seconds
+    while time.perf_counter() < end:
+        pass
+    time.sleep(io_seconds)
+    return os.getpid()
+
+
+def run_profile(profile, tasks, workers, io_scale, seed):
+    pool, concurrency, _, _, worker_options = PROFILES[profile]
+    env = dict(os.environ, BENCH_PROFILE=profile)
+    queue = f"bench_{profile}"
+    worker_procs = [
+        subprocess.Popen(
+            [sys.executable, '-m', 'celery', '-A', 'benchmarks.bench_celery_throughput:app', 'worker',
+             '-P', pool, '-c', str(concurrency), '-Q', queue, '-n', f'bench{i}_{profile}@%h',
+             '--without-gossip', '--without-mingle', '--without-heartbeat', '--loglevel=warning', *worker_options],
+            env=env,
+        )
+        for i in range(workers)
+    ]
+    try:
+        time.sleep(5)  # let the workers connect before publishing
+        rng = random.Random(seed)
+        start = time.perf_counter()
+        results = [
+            app.send_task('bench.simulated_report', args=[0.02, rng.uniform(0.2, 3.0) * io_scale], queue=queue)
+            for _ in range(tasks)
+        ]
+        for result in results:
+            result.get(timeout=600)
+        elapsed = time.perf_counter() - start
+    finally:
+        for proc in worker_procs:
+            proc.terminate()
+        for proc in worker_procs:
+            proc.wait()
+
+    # OS processes doing work: every prefork child, or one process per threads/gevent worker
+    processes = workers * (concurrency if pool == 'prefork' else 1)
+    return elapsed, tasks / elapsed * 60, tasks / elapsed * 60 / processes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tasks', type=int, default=40)
+    parser.add_argument('--workers', type=int, default=2, help="worker instances per profile")
+    parser.add_argument('--io-scale', type=float, default=1.0, help="multiplier for the simulated LLM wait")
+    parser.add_argument('--profiles', nargs='+', default=['default', 'tuned', 'threads'], choices=sorted(PROFILES))
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'profile':<10} {'pool':<8} {'conc':>5} {'elapsed s':>10} {'tasks/min':>10} {'tasks/min/process':>18}")
+    for profile in args.profiles:
+        elapsed, throughput, per_process = run_profile(profile, args.tasks, args.workers, args.io_scale, args.seed)
+        pool, concurrency, _, _, _ = PROFILES[profile]
+        print(f"{profile:<10} {pool:<8} {concurrency:>5} {elapsed:>10.1f} {throughput:>10.1f} {per_process:>18.1f}")
+
+
+if __name__ == '__main__':
+    main()
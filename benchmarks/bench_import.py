@@ -0,0 +1,72 @@
+"""Import-time benchmark for the web and worker entry points.
+
+Each target is imported in a fresh interpreter so nothing is cached between runs.
+
+    python -m benchmarks.bench_import [--runs 10] [--importtime]
+"""
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = {
+    # What gunicorn does when a web dyno boots
+    'web': "import app; app.create_app()",
+    # What a Celery worker imports before it can accept tasks
+    'worker': "import celery_worker; import adult_report_generator",
+}
+
+TIMER = """
+import time
+start = time.perf_counter()
+{code}
+print(time.perf_counter() - start)
+"""
+
+
+def time_target(code, runs):
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, '-c', TIMER.format(code=code)],
+            cwd=ROOT, capture_output=True, text=True, check=True
+        )
+        samples.append(float(result.stdout.strip().splitlines()[-1]))
+    return samples
+
+
+def top_imports(code, limit=15):
+    """Return the slowest modules (cumulative microseconds) reported by -X importtime."""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code],
+        cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        rows.append((int(cumulative_us), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--importtime', action='store_true', help="also list the slowest imports per target")
+    args = parser.parse_args()
+
+    for name, code in TARGETS.items():
+        samples = time_target(code, args.runs)
+        print(f"{name:<8} median {statistics.median(samples) * 1000:8.1f} ms   "
+              f"min {min(samples) * 1000:8.1f} ms   max {max(samples) * 1000:8.1f} ms   ({args.runs} runs)")
+        if args.importtime:
+            for cumulative_us, module in top_imports(code):
+                print(f"    {cumulative_us / 1000:8.1f} ms  {module}")
+
+
+if __name__ == '__main__':
+    main()
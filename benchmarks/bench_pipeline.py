@@ -0,0 +1,250 @@
+"""End-to-end pipeline benchmark that runs offline.
+
+Runs generate_full_report (or the canvas or pipelined workflow) and, optionally, the Flask routes
+against in-process stand-ins: moto for S3, fakeredis for Redis and a local fake of the
+OpenAI chat completions API with configurable latency and token rate. Assessment PDFs
+are generated on the fly, so the run needs no credentials or network.
+
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.bench_pipeline [--reports 4] [--concurrency 2] [--workflow single|canvas|pipelined]
+        [--llm-ttft 0.5] [--llm-tps 80] [--routes] [--compare benchmarks/results/<run>.json]
+        [--replay llm_capture.jsonl --replay-speed 1]
+
+A quick smoke run of the whole harness, routes included:
+
+    python -m benchmarks.bench_pipeline --reports 1 --concurrency 1 --llm-ttft 0 --routes
+
+With --replay, chat completions are answered from a capture recorded in production with
+OPENAI_CAPTURE_MODE=record (see llm_recording) instead of the fake server.
+
+Results are written to benchmarks/results/. With --compare the run exits non-zero when a
+stage median or the report throughput is worse than the baseline by more than --threshold.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import resource
+import statistics
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.fakes import FakeOpenAIServer, make_assessment_set, start_local_s3, use_fake_redis
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+BUCKET = 'par-bench'
+CREDENTIALS = ('bench', 'bench', 'us-east-1')
+
+
+def configure_environment(fake_openai, replay=None, replay_speed=1.0):
+    """Must run before any project module that reads settings at import time."""
+    if replay:
+        os.environ.update({
+            'OPENAI_CAPTURE_MODE': 'replay',
+            'OPENAI_CAPTURE_FILE': replay,
+            'OPENAI_REPLAY_SPEED': str(replay_speed),
+        })
+    os.environ.update({
+        'TRACE_EXPORT': 'none',
+        # Task results stay in this process, like everything else the harness fakes
+        'CELERY_RESULT_BACKEND': 'cache+memory://',
+        'OPENAI_API_KEY': 'bench',
+        'OPENAI_BASE_URL': fake_openai.base_url,
+        'S3_BUCKET': BUCKET,
+        'AWS_ACCESS_KEY_ID': CREDENTIALS[0],
+        'AWS_SECRET_ACCESS_KEY': CREDENTIALS[1],
+        'AWS_DEFAULT_REGION': CREDENTIALS[2],
+    })
+
+
+def upload_inputs(session_id, files):
+    from s3_utils import get_s3_client
+
+    s3 = get_s3_client(*CREDENTIALS)
+    s3_paths = {}
+    for filename, body in files.items():
+        key = f"uploads/{session_id}/{filename}"
+        s3.put_object(Bucket=BUCKET, Key=key, Body=body)
+        s3_paths[filename] = key
+    return s3_paths
+
+
+def run_report(workflow, files):
+    """Generate one report in this thread; returns (seconds, final status snapshot)."""
+    from celery_config import INTERACTIVE_QUEUE, get_celery
+    from progress import get_status, mark_queued
+    from report_workflow import build_report_workflow, build_pipelined_workflow, extract_file_signature
+    from adult_report_generator import generate_full_report
+
+    session_id = str(uuid.uuid4())
+    if workflow == 'pipelined':
+        # Uploads are part of the measured time: extraction overlaps them
+        mark_queued(session_id, INTERACTIVE_QUEUE)
+        start = time.perf_counter()
+        build_pipelined_workflow(get_celery(), INTERACTIVE_QUEUE, session_id, *CREDENTIALS, BUCKET)
+        for filename, s3_key in upload_inputs(session_id, files).items():
+            extract_file_signature(get_celery(), INTERACTIVE_QUEUE, session_id, filename, s3_key, *CREDENTIALS, BUCKET).apply()
+        return time.perf_counter() - start, get_status(session_id) or {}
+
+    s3_paths = upload_inputs(session_id, files)
+    mark_queued(session_id, INTERACTIVE_QUEUE)
+    start = time.perf_counter()
+    if workflow == 'canvas':
+        build_report_workflow(get_celery(), INTERACTIVE_QUEUE, session_id, s3_paths, *CREDENTIALS, BUCKET).apply()
+    else:
+        generate_full_report.apply(args=[session_id, s3_paths, None, *CREDENTIALS, BUCKET])
+    return time.perf_counter() - start, get_status(session_id) or {}
+
+
+def run_routes(files):
+    """Drive one report through the web routes with tasks executed eagerly in-process."""
+    from app import create_app
+
+    app = create_app()
+    app.config['REPORT_WORKFLOW'] = 'canvas'  # send_task by name bypasses eager mode
+    client = app.test_client()
+    timings = {}
+
+    def timed(route, call):
+        start = time.perf_counter()
+        response = call()
+        timings[route] = round(time.perf_counter() - start, 4)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{route} returned {response.status_code}")
+        return response
+
+    from io import BytesIO
+    upload = {'assessment_files': [(BytesIO(body), filename) for filename, body in files.items()]}
+    timed('POST /', lambda: client.post('/', data=upload, content_type='multipart/form-data'))
+    timed('GET /processing', lambda: client.get('/processing'))
+    timed('GET /status', lambda: client.get('/status'))
+    timed('GET /results', lambda: client.get('/results'))
+    timed('GET /download_file', lambda: client.get('/download_file'))
+    return timings
+
+
+def summarize(durations, statuses, elapsed, reports):
+    stages = {}
+    for status in statuses:
+        for stage in status.get('completed_stages', []):
+            stages.setdefault(stage['stage'], []).append(stage['duration'])
+    failed = sum(1 for status in statuses if status.get('state') != 'SUCCESS')
+    return {
+        'reports': reports,
+        'failed': failed,
+        'elapsed_seconds': round(elapsed, 3),
+        'reports_per_minute': round(reports / elapsed * 60, 3),
+        'report_seconds': percentiles(durations),
+        'stages': {stage: percentiles(values) for stage, values in sorted(stages.items())},
+        # ru_maxrss is KiB on Linux
+        'peak_rss_mb': round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def percentiles(values):
+    ordered = sorted(values)
+    return {
+        'median': round(statistics.median(ordered), 4),
+        'p95': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 4),
+        'max': round(ordered[-1], 4),
+    }
+
+
+def compare(result, baseline, threshold):
+    """Names of measurements that regressed by more than `threshold` (a fraction)."""
+    regressions = []
+    for stage, current in result['stages'].items():
+        before = baseline.get('stages', {}).get(stage)
+        if before and current['median'] > before['median'] * (1 + threshold):
+            regressions.append(f"{stage}: median {before['median']}s -> {current['median']}s")
+    before_rate = baseline.get('reports_per_minute')
+    if before_rate and result['reports_per_minute'] < before_rate * (1 - threshold):
+        regressions.append(f"throughput: {before_rate} -> {result['reports_per_minute']} reports/min")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_summary(result):
+    print(f"{result['reports']} reports ({result['failed']} failed) in {result['elapsed_seconds']}s: "
+          f"{result['reports_per_minute']} reports/min, peak RSS {result['peak_rss_mb']} MB")
+    print(f"{'stage':<40} {'median':>9} {'p95':>9} {'max':>9}")
+    for stage, stats in result['stages'].items():
+        print(f"{stage:<40} {stats['median']:>9.3f} {stats['p95']:>9.3f} {stats['max']:>9.3f}")
+    for route, seconds in result.get('routes', {}).items():
+        print(f"{route:<40} {seconds:>9.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--reports', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=2)
+    parser.add_argument('--workflow', choices=['single', 'canvas', 'pipelined'], default='single')
+    parser.add_argument('--llm-ttft', type=float, default=0.5, help='seconds before the first token')
+    parser.add_argument('--llm-tps', type=float, default=80.0, help='completion tokens per second')
+    parser.add_argument('--completion-tokens', type=int, default=600)
+    parser.add_argument('--replay', help='answer chat completions from this capture file')
+    parser.add_argument('--replay-speed', type=float, default=1.0, help='replay latency divisor (0: no delay)')
+    parser.add_argument('--transcript-pages', type=int, default=20)
+    parser.add_argument('--routes', action='store_true', help='also time the Flask routes for one report')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='results file (default: benchmarks/results/<timestamp>.json)')
+    parser.add_argument('--compare', help='baseline results file to check for regressions')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown as a fraction')
+    args = parser.parse_args()
+
+    fake_openai = FakeOpenAIServer(ttft=args.llm_ttft, tokens_per_second=args.llm_tps,
+                                   completion_tokens=args.completion_tokens, seed=args.seed).start()
+    configure_environment(fake_openai, args.replay, args.replay_speed)
+    s3_mock = start_local_s3(BUCKET)
+    use_fake_redis()
+
+    from celery_config import get_celery
+    get_celery().conf.update(task_always_eager=True, task_store_eager_result=True)
+
+    files = make_assessment_set(transcript_pages=args.transcript_pages, seed=args.seed)
+    try:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            outcomes = list(pool.map(lambda _: run_report(args.workflow, files), range(args.reports)))
+        elapsed = time.perf_counter() - start
+        result = summarize([seconds for seconds, _ in outcomes], [status for _, status in outcomes], elapsed, args.reports)
+        if args.routes:
+            result['routes'] = run_routes(files)
+    finally:
+        s3_mock.stop()
+        fake_openai.stop()
+
+    result.update({
+        'commit': git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'settings': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+    })
+    print_summary(result)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-{args.workflow}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,400 @@
+"""Load test for the web tier: latency per route and saturation per gunicorn worker class.
+
+Starts gunicorn against local stand-ins (moto's S3 server and a TCP fakeredis, or a real
+Redis with --redis-url) and sends it simulated users arriving at a Poisson rate. Rates are
+stepped up until the p95 of a route passes --slo or requests start failing.
+
+User types (weights set with --mix):
+  clinician   GET /, upload the nine PDFs, follow /progress_stream until the report is ready
+              (polling /processing and /status every --poll-interval if the stream fails),
+              then /results and /download_file
+  streamer    a processing tab holding /progress_stream open until its report completes,
+              reconnecting like EventSource when the server closes the stream
+  watcher     an idle processing tab polling /status/<task_id> of a report still in progress
+              (browsers without EventSource)
+  downloader  /results and /download_file of a finished report
+
+No Celery worker runs; reports are "finished" by the harness --report-seconds after upload
+by storing the result and a PDF and publishing the final progress event the way the worker
+would. GET /progress_stream is timed to the first line of the stream; an open stream still
+occupies a sync worker or gthread thread for as long as it is held.
+
+    pip install -r benchmarks/requirements.txt
+    python -m benchmarks.bench_web_load [--worker-classes sync gthread gevent] [--rates 1 2 4 8]
+        [--duration 30] [--mix clinician=1,streamer=4,downloader=1] [--workers 2] [--threads 8]
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from http.cookiejar import CookieJar
+
+from benchmarks.fakes import free_port, make_assessment_pdf, make_assessment_set, start_redis_server, start_s3_server
+from benchmarks.bench_pipeline import RESULTS_DIR, ROOT, git_commit, percentiles
+
+BUCKET = 'par-bench'
+SECRET_KEY = 'bench-secret'
+SEEDED_SESSIONS = 50
+REQUEST_TIMEOUT = 60
+STREAM_RETRY_SECONDS = 2  # the "retry:" the stream sends to EventSource
+FINAL_EVENTS = ('complete', 'error')
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Redirects are requests of their own; the user follows them explicitly
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Client:
+    """One browser: its own cookie jar, records (route, seconds, status) for every request."""
+
+    def __init__(self, base_url, samples, cookie=None):
+        self.base_url = base_url
+        self.samples = samples
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(CookieJar()), NoRedirect())
+        self.headers = {'Cookie': cookie} if cookie else {}
+
+    def request(self, route, path=None, data=None, headers=None):
+        req = urllib.request.Request(self.base_url + (path or route.split(' ', 1)[1]), data=data,
+                                     headers={**self.headers, **(headers or {})})
+        start = time.perf_counter()
+        try:
+            with self.opener.open(req, timeout=REQUEST_TIMEOUT) as response:
+                body = response.read()
+                status = response.status
+                location = None
+        except urllib.error.HTTPError as e:
+            body, status, location = e.read(), e.code, e.headers.get('Location')
+        except OSError:
+            body, status, location = b'', 0, None
+        self.samples.append((route, time.perf_counter() - start, status))
+        return status, body, location
+
+    def stream(self, route, path=None):
+        """Read an event stream until a final event or until the server closes it.
+
+        Returns the last event name ('' if there was none), or None if the stream could not be
+        opened or broke off. Only the time to the first line is recorded.
+        """
+        req = urllib.request.Request(self.base_url + (path or route.split(' ', 1)[1]),
+                                     headers={**self.headers, 'Accept': 'text/event-stream'})
+        start = time.perf_counter()
+        opened = False
+        last_event = ''
+        try:
+            with self.opener.open(req, timeout=REQUEST_TIMEOUT) as response:
+                response.readline()
+                self.samples.append((route, time.perf_counter() - start, response.status))
+                opened = True
+                for line in response:
+                    if line.startswith(b'event: '):
+                        last_event = line[len(b'event: '):].strip().decode()
+                        if last_event in FINAL_EVENTS:
+                            break
+            return last_event
+        except urllib.error.HTTPError as e:
+            e.read()
+            self.samples.append((route, time.perf_counter() - start, e.code))
+        except OSError:
+            if not opened:
+                self.samples.append((route, time.perf_counter() - start, 0))
+        return None
+
+
+def multipart(files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for filename, content in files.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="assessment_files"; filename="{filename}"\r\n'
+            f'Content-Type: application/pdf\r\n\r\n'.encode() + content + b'\r\n'
+        )
+    return b''.join(parts) + f'--{boundary}--\r\n'.encode(), f'multipart/form-data; boundary={boundary}'
+
+
+class Harness:
+    """Seeds reports and plays the part of the Celery worker for reports uploaded during the run."""
+
+    def __init__(self, args):
+        from celery_config import get_celery
+        from progress import mark_queued, publish_progress
+        from s3_utils import get_s3_client
+
+        self.args = args
+        self.celery = get_celery()
+        self.mark_queued = mark_queued
+        self.publish_progress = publish_progress
+        self.s3 = get_s3_client('bench', 'bench', 'us-east-1')
+        self.report_pdf = make_assessment_pdf('Generated PAR', pages=args.report_pages)
+        self.files = make_assessment_set(transcript_pages=args.transcript_pages)
+        self.upload_body = multipart(self.files)
+        self.pending = [self.seed(finished=False) for _ in range(SEEDED_SESSIONS)]
+        self.finished = [self.seed(finished=True) for _ in range(SEEDED_SESSIONS)]
+
+    def seed(self, finished):
+        session_id, task_id = str(uuid.uuid4()), str(uuid.uuid4())
+        self.mark_queued(session_id)
+        if finished:
+            self.finish(session_id, task_id)
+        return session_id, task_id
+
+    def finish(self, session_id, task_id):
+        s3_path = f'{session_id}/generated_par.pdf'
+        self.s3.put_object(Bucket=BUCKET, Key=s3_path, Body=self.report_pdf)
+        self.celery.backend.store_result(task_id, {'status': 'success', 's3_path': s3_path}, 'SUCCESS')
+        self.publish_progress(session_id, 'complete', s3_path=s3_path)
+
+    def finish_later(self, session_id, task_id):
+        timer = threading.Timer(self.args.report_seconds, self.finish, args=(session_id, task_id))
+        timer.daemon = True
+        timer.start()
+
+    def session_cookie(self, session_id, task_id):
+        """A signed Flask session cookie for a report the user did not upload in this run."""
+        from flask import Flask
+        from flask.sessions import SecureCookieSessionInterface
+
+        app = Flask('bench')
+        app.secret_key = SECRET_KEY
+        value = SecureCookieSessionInterface().get_signing_serializer(app).dumps({
+            'id': session_id, 'task_id': task_id, 's3_report_path': f'{session_id}/generated_par.pdf'
+        })
+        return f"session={value}"
+
+
+def clinician(client, harness):
+    client.request('GET /')
+    body, content_type = harness.upload_body
+    status, _, _ = client.request('POST /', data=body, headers={'Content-Type': content_type})
+    if status != 302:
+        return
+    status, body, _ = client.request('GET /status')
+    if status != 200:
+        return
+    report = json.loads(body)
+    harness.finish_later(report['session_id'], report['task_id'])
+    deadline = time.time() + harness.args.report_seconds * 3
+    # The processing page follows the stream, checks /processing on the final event and
+    # only polls when the stream fails
+    event = follow_stream(client, deadline)
+    if event is None:
+        if not poll_processing(client, harness, deadline):
+            return
+    elif event == 'complete':
+        client.request('GET /processing')
+    else:
+        return
+    client.request('GET /results')
+    client.request('GET /download_file')
+
+
+def follow_stream(client, deadline):
+    """Hold /progress_stream until a final event; returns it, or None if the stream failed."""
+    while time.time() < deadline:
+        event = client.stream('GET /progress_stream')
+        if event is None or event in FINAL_EVENTS:
+            return event
+        time.sleep(STREAM_RETRY_SECONDS)
+    return None
+
+
+def poll_processing(client, harness, deadline):
+    """Poll /processing and /status until /processing redirects to the results."""
+    while time.time() < deadline:
+        status, _, location = client.request('GET /processing')
+        if status == 302 and location and location.endswith('/results'):
+            return True
+        if status != 200:
+            return False
+        client.request('GET /status')
+        time.sleep(harness.args.poll_interval)
+    return False
+
+
+def streamer(client, harness):
+    session_id, task_id = harness.seed(finished=False)
+    client.headers['Cookie'] = harness.session_cookie(session_id, task_id)
+    harness.finish_later(session_id, task_id)
+    follow_stream(client, time.time() + harness.args.report_seconds * 3)
+
+
+def watcher(client, harness):
+    _, task_id = random.choice(harness.pending)
+    end = time.time() + harness.args.report_seconds
+    while time.time() < end:
+        client.request('GET /status/<task_id>', path=f'/status/{task_id}')
+        time.sleep(harness.args.poll_interval)
+
+
+def downloader(client, harness):
+    client.headers['Cookie'] = harness.session_cookie(*random.choice(harness.finished))
+    client.request('GET /results')
+    client.request('GET /download_file')
+
+
+USERS = {'clinician': clinician, 'streamer': streamer, 'watcher': watcher, 'downloader': downloader}
+
+
+def start_gunicorn(worker_class, workers, threads, env):
+    port = free_port()
+    cmd = [sys.executable, '-m', 'gunicorn', 'app:create_app()', '-b', f'127.0.0.1:{port}',
+           '-k', worker_class, '-w', str(workers), '--log-level', 'warning']
+    if worker_class == 'gthread':
+        cmd += ['--threads', str(threads)]
+    elif worker_class == 'gevent':
+        cmd += ['--worker-connections', str(threads * 50)]
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env)
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(100):
+        try:
+            urllib.request.urlopen(base_url + '/', timeout=1).read()
+            return proc, base_url
+        except OSError:
+            time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError(f"gunicorn ({worker_class}) did not start")
+
+
+def run_step(base_url, harness, rate, duration, mix):
+    """Poisson arrivals at `rate` users/second for `duration` seconds; waits for users to finish."""
+    samples = []
+    names, weights = zip(*mix.items())
+    users = []
+    rng = random.Random(rate)
+    start = time.time()
+    next_arrival = start
+    while next_arrival < start + duration:
+        time.sleep(max(0.0, next_arrival - time.time()))
+        user = USERS[rng.choices(names, weights)[0]]
+        thread = threading.Thread(target=user, args=(Client(base_url, samples), harness), daemon=True)
+        thread.start()
+        users.append(thread)
+        next_arrival += rng.expovariate(rate)
+    for thread in users:
+        thread.join(timeout=max(0.0, start + duration + harness.args.drain - time.time()))
+    elapsed = time.time() - start
+    return summarize_step(list(samples), rate, len(users), elapsed)
+
+
+def summarize_step(samples, rate, users, elapsed):
+    routes = {}
+    for route, seconds, status in samples:
+        routes.setdefault(route, []).append((seconds, status))
+    errors = sum(1 for _, _, status in samples if status == 0 or status >= 500)
+    return {
+        'rate': rate,
+        'users': users,
+        'requests': len(samples),
+        'requests_per_second': round(len(samples) / elapsed, 2),
+        'error_rate': round(errors / len(samples), 4) if samples else 0.0,
+        'routes': {
+            route: {**percentiles([seconds for seconds, _ in values]), 'count': len(values),
+                    'p99': round(sorted(s for s, _ in values)[min(len(values) - 1, int(len(values) * 0.99))], 4)}
+            for route, values in sorted(routes.items())
+        },
+    }
+
+
+def saturated(step, slo, max_error_rate):
+    return step['error_rate'] > max_error_rate or any(stats['p95'] > slo for stats in step['routes'].values())
+
+
+def print_step(worker_class, step):
+    print(f"\n[{worker_class}] {step['rate']} users/s: {step['users']} users, {step['requests']} requests, "
+          f"{step['requests_per_second']} req/s, {step['error_rate']:.1%} errors")
+    print(f"  {'route':<28} {'count':>7} {'median':>8} {'p95':>8} {'p99':>8} {'max':>8}")
+    for route, stats in step['routes'].items():
+        print(f"  {route:<28} {stats['count']:>7} {stats['median']:>8.3f} {stats['p95']:>8.3f} "
+              f"{stats['p99']:>8.3f} {stats['max']:>8.3f}")
+
+
+def parse_mix(value):
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name not in USERS:
+            raise argparse.ArgumentTypeError(f"unknown user type {name!r}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--worker-classes', nargs='+', default=['sync', 'gthread', 'gevent'])
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=8, help='threads per gthread worker (x50 gevent connections)')
+    parser.add_argument('--rates', nargs='+', type=float, default=[1, 2, 4, 8, 16], help='user arrivals per second')
+    parser.add_argument('--duration', type=float, default=30, help='seconds of arrivals per rate')
+    parser.add_argument('--drain', type=float, default=60, help='seconds to wait for users after arrivals stop')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('clinician=1,streamer=4,downloader=1'))
+    parser.add_argument('--poll-interval', type=float, default=5.0, help='seconds between polls (the page uses 5)')
+    parser.add_argument('--report-seconds', type=float, default=20.0, help='time from upload to finished report')
+    parser.add_argument('--transcript-pages', type=int, default=20)
+    parser.add_argument('--report-pages', type=int, default=15)
+    parser.add_argument('--slo', type=float, default=1.0, help='p95 seconds per route before a rate counts as saturated')
+    parser.add_argument('--max-error-rate', type=float, default=0.01)
+    parser.add_argument('--redis-url', help='use this Redis instead of a local fakeredis server')
+    parser.add_argument('--output', help='results file (default: benchmarks/results/<timestamp>-web.json)')
+    args = parser.parse_args()
+
+    s3_server, s3_endpoint = start_s3_server(BUCKET)
+    redis_url = args.redis_url or start_redis_server()[1]
+    os.environ.update({
+        'TRACE_EXPORT': 'none',
+        'SECRET_KEY': SECRET_KEY,
+        'S3_BUCKET': BUCKET,
+        'S3_ENDPOINT_URL': s3_endpoint,
+        'AWS_ACCESS_KEY_ID': 'bench',
+        'AWS_SECRET_ACCESS_KEY': 'bench',
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'REDIS_URL': redis_url,
+        'CELERY_BROKER_URL': redis_url,
+        'CELERY_RESULT_BACKEND': redis_url,
+    })
+    harness = Harness(args)
+
+    result = {'commit': git_commit(), 'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+              'settings': {key: value for key, value in vars(args).items() if key != 'output'}, 'worker_classes': {}}
+    try:
+        for worker_class in args.worker_classes:
+            proc, base_url = start_gunicorn(worker_class, args.workers, args.threads, dict(os.environ))
+            steps = []
+            try:
+                for rate in args.rates:
+                    step = run_step(base_url, harness, rate, args.duration, args.mix)
+                    print_step(worker_class, step)
+                    steps.append(step)
+                    if saturated(step, args.slo, args.max_error_rate):
+                        break
+            finally:
+                proc.terminate()
+                proc.wait()
+            sustained = [step['rate'] for step in steps if not saturated(step, args.slo, args.max_error_rate)]
+            result['worker_classes'][worker_class] = {
+                'steps': steps,
+                'max_sustained_rate': max(sustained) if sustained else None,
+            }
+    finally:
+        s3_server.stop()
+
+    print("\nHighest arrival rate within the SLO (users/s):")
+    for worker_class, outcome in result['worker_classes'].items():
+        print(f"  {worker_class:<10} {outcome['max_sustained_rate']}")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{time.strftime('%Y%m%d-%H%M%S')}-web.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(f"Results written to {output}")
+
+
+if __name__ == '__main__':
+    main()
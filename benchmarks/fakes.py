@@ -0,0 +1,210 @@
+"""Local stand-ins used by the benchmarks: a fake OpenAI server, synthetic assessment PDFs,
+an in-process S3 (moto) and an in-process Redis (fakeredis), plus network-reachable
+versions of the last two for benchmarks that run the app in separate processes.
+
+Install the extra dependencies with `pip install -r benchmarks/requirements.txt`.
+"""
+import io
+import json
+import time
+import random
+import socket
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = (
+    "assessment patient reported history social communication anxiety sensory "
+    "profile adaptive functioning scores indicate clinically significant range "
+    "interview observed reciprocal interaction restricted interests daily living"
+).split()
+
+
+def fake_text(rng, tokens):
+    """Markdown of roughly `tokens` tokens (one word ~ 1.3 tokens), shaped like a report section."""
+    words = [rng.choice(WORDS) for _ in range(int(tokens / 1.3))]
+    lines = ["## Generated Section", ""]
+    for i in range(0, len(words), 40):
+        lines.append(' '.join(words[i:i + 40]).capitalize() + '.')
+        lines.append("")
+    return '\n'.join(lines)
+
+
+class FakeOpenAIServer:
+    """Serves /v1/chat/completions with configurable latency and completion size.
+
+    Each call waits `ttft` seconds (time to first token) plus `completion_tokens / tokens_per_second`,
+    with +/- `jitter` relative noise. Streaming requests get the tokens as SSE chunks over that time.
+    """
+
+    def __init__(self, ttft=0.5, tokens_per_second=80.0, completion_tokens=600, jitter=0.2, seed=0, port=0):
+        self.ttft = ttft
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/v1"
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+    def _plan(self, body):
+        with self.lock:
+            self.calls += 1
+            noise = 1 + self.rng.uniform(-self.jitter, self.jitter)
+            seed = self.rng.random()
+        completion_tokens = min(body.get('max_tokens') or self.completion_tokens, self.completion_tokens)
+        prompt_chars = sum(len(m.get('content') or '') for m in body.get('messages', []))
+        duration = (self.ttft + completion_tokens / self.tokens_per_second) * noise
+        return completion_tokens, prompt_chars // 4, duration, random.Random(seed)
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                if not self.path.endswith('/chat/completions'):
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                completion_tokens, prompt_tokens, duration, rng = fake._plan(body)
+                text = fake_text(rng, completion_tokens)
+                usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                         'total_tokens': prompt_tokens + completion_tokens}
+                base = {'id': f'chatcmpl-fake-{fake.calls}', 'created': int(time.time()), 'model': body.get('model')}
+                if body.get('stream'):
+                    self._stream(base, text, duration, usage)
+                else:
+                    time.sleep(duration)
+                    self._json({**base, 'object': 'chat.completion', 'usage': usage, 'choices': [{
+                        'index': 0, 'finish_reason': 'stop',
+                        'message': {'role': 'assistant', 'content': text},
+                    }]})
+
+            def _json(self, payload):
+                data = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, base, text, duration, usage):
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/event-stream')
+                self.send_header('Connection', 'close')
+                self.end_headers()
+                time.sleep(fake.ttft)
+                chunks = text.split(' ')
+                delay = max(duration - fake.ttft, 0) / max(len(chunks), 1)
+                for i, chunk in enumerate(chunks):
+                    event = {**base, 'object': 'chat.completion.chunk', 'choices': [{
+                        'index': 0, 'finish_reason': None,
+                        'delta': {'content': chunk + (' ' if i < len(chunks) - 1 else '')},
+                    }]}
+                    self.wfile.write(f"data: {json.dumps(event)}\n\n".encode())
+                    time.sleep(delay)
+                final = {**base, 'object': 'chat.completion.chunk', 'usage': usage,
+                         'choices': [{'index': 0, 'finish_reason': 'stop', 'delta': {}}]}
+                self.wfile.write(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode())
+                self.close_connection = True
+
+        return Handler
+
+
+def make_assessment_pdf(title, pages, lines_per_page=45, seed=0):
+    """A text-layer PDF resembling a scored assessment or transcript."""
+    from reportlab.lib.pagesizes import letter
+    from reportlab.pdfgen import canvas
+
+    rng = random.Random(f"{title}-{seed}")
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=letter)
+    for page in range(pages):
+        pdf.setFont("Helvetica-Bold", 12)
+        pdf.drawString(72, 750, f"{title} - page {page + 1}")
+        pdf.setFont("Helvetica", 9)
+        for line in range(lines_per_page):
+            pdf.drawString(72, 730 - line * 14, ' '.join(rng.choice(WORDS) for _ in range(14)))
+        pdf.showPage()
+    pdf.save()
+    return buffer.getvalue()
+
+
+def make_assessment_set(transcript_pages=20, result_pages=2, seed=0):
+    """Synthetic versions of the nine required uploads, keyed by filename."""
+    from app import REQUIRED_FILES
+
+    return {
+        filename: make_assessment_pdf(filename[:-4], transcript_pages if filename == 'Transcript.pdf' else result_pages, seed=seed)
+        for filename in sorted(REQUIRED_FILES)
+    }
+
+
+def start_local_s3(bucket):
+    """Route every boto3 client in this process to moto's in-memory S3 and create `bucket`."""
+    import boto3
+    from moto import mock_aws
+
+    mock = mock_aws()
+    mock.start()
+    boto3.client('s3', region_name='us-east-1').create_bucket(Bucket=bucket)
+    return mock
+
+
+def use_fake_redis():
+    """Point the app's Redis helpers (state, metrics, progress, broker inspection) at fakeredis."""
+    import fakeredis
+    import redis_utils
+
+    server = fakeredis.FakeServer()
+    redis_utils._redis_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    redis_utils._broker_client = fakeredis.FakeRedis(server=server, decode_responses=True)
+    return redis_utils._redis_client
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_s3_server(bucket):
+    """Serve moto's S3 over HTTP for other processes (set S3_ENDPOINT_URL to the returned URL)."""
+    import boto3
+    from moto.server import ThreadedMotoServer
+
+    port = free_port()
+    server = ThreadedMotoServer(ip_address='127.0.0.1', port=port)
+    server.start()
+    endpoint_url = f"http://127.0.0.1:{port}"
+    boto3.client('s3', endpoint_url=endpoint_url, region_name='us-east-1',
+                 aws_access_key_id='bench', aws_secret_access_key='bench').create_bucket(Bucket=bucket)
+    return server, endpoint_url
+
+
+def start_redis_server():
+    """Serve fakeredis over TCP for other processes; returns (server, redis_url)."""
+    from fakeredis import TcpFakeServer
+
+    port = free_port()
+    server = TcpFakeServer(('127.0.0.1', port), server_type='redis')
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"redis://127.0.0.1:{port}/0"
@@ -0,0 +1,123 @@
+import hashlib
+import logging
+from datetime import datetime, timezone
+import redis
+from botocore.exceptions import ClientError
+from redis_utils import get_redis
+from metrics import inc
+from tracing import start_span
+
+# blob_store.py
+# Content-addressed storage of uploaded PDFs. A file is stored once at blobs/{sha256}.pdf no
+# matter how many sessions upload it; a session refers to its blobs by key. Re-submitting
+# the same PDFs therefore uploads nothing, and the text extracted from a blob is cached
+# under its hash so it is parsed only once.
+#
+# Blobs expire like uploads (see retention). Reusing a blob refreshes its LastModified with
+# a server-side copy, at most once per BLOB_TOUCH_INTERVAL, so blobs still in use are kept.
+
+BLOB_PREFIX = 'blobs/'
+BLOB_TOUCH_INTERVAL = 86400  # seconds
+BLOB_TEXT_TTL = 7 * 86400  # seconds
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def blob_key(digest):
+    return f"{BLOB_PREFIX}{digest}.pdf"
+
+def blob_digest(s3_key):
+    """The content hash of a blob key, or None for keys outside the blob store."""
+    if not s3_key.startswith(BLOB_PREFIX):
+        return None
+    return s3_key[len(BLOB_PREFIX):].split('.', 1)[0]
+
+def blob_known_key(digest):
+    return f"par:blob:{digest}"
+
+def blob_text_key(digest):
+    return f"par:blob_text:{digest}"
+
+def hash_fileobj(fileobj):
+    digest = hashlib.sha256()
+    size = 0
+    for chunk in iter(lambda: fileobj.read(HASH_CHUNK_SIZE), b''):
+        digest.update(chunk)
+        size += len(chunk)
+    fileobj.seek(0)
+    return digest.hexdigest(), size
+
+def _recently_seen(digest):
+    try:
+        return get_redis().exists(blob_known_key(digest)) == 1
+    except redis.RedisError as e:
+        logging.warning(f"Failed to read blob cache for {digest}: {e}")
+        return False
+
+def _mark_seen(digest):
+    try:
+        get_redis().set(blob_known_key(digest), 1, ex=BLOB_TOUCH_INTERVAL)
+    except redis.RedisError as e:
+        logging.warning(f"Failed to update blob cache for {digest}: {e}")
+
+def _existing_blob_age(s3, bucket, key):
+    """Seconds since the blob was last written, or None if it does not exist."""
+    try:
+        response = s3.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+    return (datetime.now(timezone.utc) - response['LastModified']).total_seconds()
+
+def store_blob(s3, bucket, fileobj):
+    """Store `fileobj` under its content hash unless it is already there.
+
+    Returns (s3_key, reused).
+    """
+    with start_span('blob.hash'):
+        digest, size = hash_fileobj(fileobj)
+    key = blob_key(digest)
+    if _recently_seen(digest):
+        inc('par_upload_dedup_total', result='hit')
+        inc('par_upload_dedup_bytes_total', size, result='hit')
+        return key, True
+
+    with start_span('s3.head_object', key=key):
+        age = _existing_blob_age(s3, bucket, key)
+    if age is None:
+        with start_span('s3.upload_fileobj', key=key, bytes=size):
+            s3.upload_fileobj(fileobj, bucket, key)
+        # Verify the upload
+        with start_span('s3.head_object', key=key):
+            s3.head_object(Bucket=bucket, Key=key)
+        reused = False
+    else:
+        if age > BLOB_TOUCH_INTERVAL:
+            with start_span('s3.copy_object', key=key):
+                s3.copy_object(Bucket=bucket, Key=key, CopySource={'Bucket': bucket, 'Key': key},
+                               MetadataDirective='REPLACE', ContentType='application/pdf')
+        reused = True
+    _mark_seen(digest)
+    result = 'hit' if reused else 'miss'
+    inc('par_upload_dedup_total', result=result)
+    inc('par_upload_dedup_bytes_total', size, result=result)
+    return key, reused
+
+def get_blob_text(s3_key):
+    """Previously extracted text of a blob, or None."""
+    digest = blob_digest(s3_key)
+    if digest is None:
+        return None
+    try:
+        return get_redis().get(blob_text_key(digest))
+    except redis.RedisError as e:
+        logging.warning(f"Failed to read extracted text of {s3_key}: {e}")
+        return None
+
+def save_blob_text(s3_key, text):
+    digest = blob_digest(s3_key)
+    if digest is None:
+        return
+    try:
+        get_redis().set(blob_text_key(digest), text, ex=BLOB_TEXT_TTL)
+    except redis.RedisError as e:
+        logging.warning(f"Failed to save extracted text of {s3_key}: {e}")
@@ -1,31 +1,96 @@
-from celery import Celery
-from flask import Flask
 import os
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def make_celery(app):
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
+
+# Execution profile for long-running, mostly I/O-bound report tasks.
+# CELERY_POOL may be 'prefork' (default), 'threads' or 'gevent'; the same value must be
+# passed to the worker as `-P` (see Procfile) because gevent has to patch before startup.
+CELERY_POOL = os.getenv('CELERY_POOL', 'prefork')
+CELERY_CONCURRENCY = int(os.getenv('CELERY_CONCURRENCY', 0)) or None
+CELERY_PREFETCH_MULTIPLIER = int(os.getenv('CELERY_PREFETCH_MULTIPLIER', 1))
+TASK_SOFT_TIME_LIMIT = int(os.getenv('TASK_SOFT_TIME_LIMIT', 900))  # seconds
+TASK_TIME_LIMIT = int(os.getenv('TASK_TIME_LIMIT', 1020))  # seconds
+CELERY_RESULT_EXPIRES = int(os.getenv('CELERY_RESULT_EXPIRES', 86400))  # seconds
+
+# Interactive submissions (a clinician waiting on the processing page) and bulk work
+# (backlogs, regenerations) go to separate queues, consumed by separate worker pools
+INTERACTIVE_QUEUE = os.getenv('INTERACTIVE_QUEUE', 'reports_interactive')
+BULK_QUEUE = os.getenv('BULK_QUEUE', 'reports_bulk')
+# CPU-bound stages (PDF extraction, rendering) of the stage-split workflow use a sibling
+# '.cpu' queue of each, consumed by a prefork pool (see report_workflow.cpu_queue_for);
+# extraction of long or image-only files uses a '.slow' one (see pdf_preflight)
+REPORT_QUEUES = [INTERACTIVE_QUEUE, BULK_QUEUE, f"{INTERACTIVE_QUEUE}.cpu", f"{BULK_QUEUE}.cpu",
+                 f"{INTERACTIVE_QUEUE}.slow", f"{BULK_QUEUE}.slow"]
+
+# Default worker concurrency per pool when CELERY_CONCURRENCY is not set. Green threads
+# and OS threads spend nearly all their time waiting on HTTP, so they can run many more
+# tasks per process than prefork children.
+POOL_CONCURRENCY = {'prefork': None, 'threads': 16, 'gevent': 50}
+
+_celery = None
+
+def make_celery(app=None):
+    """Build the Celery app. When a Flask app is given, tasks run inside its app context."""
+    from celery import Celery
+    from tracing import install_celery_propagation
+
     celery = Celery(
-        app.import_name,
-        backend=app.config['CELERY_RESULT_BACKEND'],
-        broker=app.config['CELERY_BROKER_URL'],
+        app.import_name if app is not None else 'par',
+        backend=CELERY_RESULT_BACKEND,
+        broker=CELERY_BROKER_URL,
         include=['adult_report_generator']
     )
-    # Remove this line: celery.conf.update(app.config)
+    apply_execution_profile(celery)
+    install_celery_propagation()
 
-    class ContextTask(celery.Task):
-        def __call__(self, *args, **kwargs):
-            with app.app_context():
-                return self.run(*args, **kwargs)
+    if app is not None:
+        class ContextTask(celery.Task):
+            def __call__(self, *args, **kwargs):
+                with app.app_context():
+                    return self.run(*args, **kwargs)
 
-    celery.Task = ContextTask
+        celery.Task = ContextTask
     return celery
 
-flask_app = Flask(__name__)
-flask_app.config.update(
-    CELERY_BROKER_URL=os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0'),
-    CELERY_RESULT_BACKEND=os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
-)
+def apply_execution_profile(celery, pool=CELERY_POOL, concurrency=CELERY_CONCURRENCY, prefetch_multiplier=CELERY_PREFETCH_MULTIPLIER):
+    celery.conf.update(
+        # Report STARTED so a running task can be told apart from one still waiting in the queue
+        task_track_started=True,
+        # Ack only after the task finishes, so a task on a worker that dies is redelivered
+        # (generate_full_report is idempotent: a finished report is not regenerated)
+        task_acks_late=True,
+        task_reject_on_worker_lost=True,
+        # Each process reserves only the task it is working on; with multi-minute tasks any
+        # prefetching leaves other workers idle while tasks wait behind a busy one
+        worker_prefetch_multiplier=prefetch_multiplier,
+        task_soft_time_limit=TASK_SOFT_TIME_LIMIT,
+        task_time_limit=TASK_TIME_LIMIT,
+        result_expires=CELERY_RESULT_EXPIRES,
+        # Redis redelivers unacked tasks after the visibility timeout; it has to outlast the
+        # hard time limit or long tasks would be executed twice
+        broker_transport_options={'visibility_timeout': TASK_TIME_LIMIT + 300},
+        task_default_queue=INTERACTIVE_QUEUE,
+        task_routes={
+            'adult_report_generator.generate_full_report': {'queue': INTERACTIVE_QUEUE},
+            'adult_report_generator.generate_section_task': {'queue': INTERACTIVE_QUEUE},
+            'adult_report_generator.collect_sections': {'queue': INTERACTIVE_QUEUE},
+            'adult_report_generator.extract_report_inputs': {'queue': f"{INTERACTIVE_QUEUE}.cpu"},
+            'adult_report_generator.extract_input_file': {'queue': f"{INTERACTIVE_QUEUE}.cpu"},
+            'adult_report_generator.render_and_upload_report': {'queue': f"{INTERACTIVE_QUEUE}.cpu"},
+            'adult_report_generator.report_failed': {'queue': f"{INTERACTIVE_QUEUE}.cpu"},
+        },
+        worker_pool=pool,
+        worker_concurrency=concurrency or POOL_CONCURRENCY.get(pool),
+    )
+    return celery
 
-celery = make_celery(flask_app)
+def get_celery():
+    """Return the process-wide Celery app, creating it on first use."""
+    global _celery
+    if _celery is None:
+        _celery = make_celery()
+    return _celery
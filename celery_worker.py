@@ -1,9 +1,8 @@
-from celery_config import celery, flask_app
-from adult_report_generator import generate_full_report
+from celery_config import get_celery
 
-# Ensure the task is registered with Celery
-celery.task(name='adult_report_generator.generate_full_report')(generate_full_report)
+# Entry point for `celery -A celery_worker.celery worker`; tasks are registered
+# through the `include` list when the worker starts.
+celery = get_celery()
 
 if __name__ == '__main__':
-    with flask_app.app_context():
-        celery.start()
+    celery.start()
@@ -18,12 +18,36 @@ class Config:
     AWS_ACCESS_KEY_ID = os.environ.get('AWS_ACCESS_KEY_ID')
     AWS_SECRET_ACCESS_KEY = os.environ.get('AWS_SECRET_ACCESS_KEY')
     AWS_REGION = os.environ.get('AWS_DEFAULT_REGION') or 'us-east-2'  # Use AWS_DEFAULT_REGION instead of AWS_REGION
+    # Set to point S3 calls at an S3-compatible server (e.g. a local stand-in for load tests)
+    S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL') or None
 
     # Session configuration
     SESSION_TYPE = 'redis'
     SESSION_PERMANENT = False
     SESSION_USE_SIGNER = True
 
+    # Per-stage time limits (seconds); the whole task is bounded by TASK_TIME_LIMIT in celery_config
+    OPENAI_TIMEOUT = float(os.environ.get('OPENAI_TIMEOUT', 180))
+    OPENAI_MAX_RETRIES = int(os.environ.get('OPENAI_MAX_RETRIES', 2))
+    S3_CONNECT_TIMEOUT = float(os.environ.get('S3_CONNECT_TIMEOUT', 10))
+    S3_READ_TIMEOUT = float(os.environ.get('S3_READ_TIMEOUT', 60))
+
+    # Time limits (seconds) of the stage tasks when REPORT_WORKFLOW is 'canvas'
+    EXTRACT_TIME_LIMIT = int(os.environ.get('EXTRACT_TIME_LIMIT', 300))
+    SECTION_TIME_LIMIT = int(os.environ.get('SECTION_TIME_LIMIT', 600))
+    RENDER_TIME_LIMIT = int(os.environ.get('RENDER_TIME_LIMIT', 300))
+
+    # 'pipelined' extracts each file as it is uploaded and starts sections as soon as their
+    # inputs are in; 'canvas' splits a report into extract/section/render tasks once every
+    # file is uploaded (see report_workflow); 'single' runs the whole pipeline in one
+    # generate_full_report task
+    REPORT_WORKFLOW = os.environ.get('REPORT_WORKFLOW', 'pipelined')
+
+    # Progress stream configuration (seconds before an SSE connection is recycled). Kept under
+    # the gunicorn worker timeout so a sync worker finishes the stream before it is killed;
+    # the browser reconnects and resumes after the last event it received
+    PROGRESS_STREAM_TIMEOUT = int(os.environ.get('PROGRESS_STREAM_TIMEOUT', 25))
+
     @staticmethod
     def init_app(app):
         pass
@@ -0,0 +1,28 @@
+import os
+
+# gunicorn.conf.py
+# The web routes spend nearly all their time waiting on S3 and Redis (uploads, status polls,
+# the progress stream, downloads). With the default gevent workers gunicorn monkey-patches
+# the standard library when each worker starts, so boto3, redis-py and kombu yield while
+# they wait and one process serves many concurrent requests. Set WEB_WORKER_CLASS=sync
+# (or gthread) to go back to one request per worker / thread.
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5000')}"
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gevent')
+
+# Concurrent requests per gevent worker; each open progress stream holds one
+worker_connections = int(os.environ.get('WEB_WORKER_CONNECTIONS', 1000))
+# Threads per worker when WEB_WORKER_CLASS=gthread
+threads = int(os.environ.get('WEB_THREADS', 8))
+
+# Seconds a sync worker may spend on one request before it is killed. Progress streams
+# close after PROGRESS_STREAM_TIMEOUT (25) seconds and the page reconnects, so keep this
+# above that for sync workers; async workers only have to check in with the arbiter.
+timeout = int(os.environ.get('WEB_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('WEB_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('WEB_KEEPALIVE', 5))
+
+# The app must be imported after the worker has patched the standard library, so never
+# preload it; create_app() is cheap (clients are created on first use).
+preload_app = False
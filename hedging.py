@@ -0,0 +1,168 @@
+import os
+import time
+import logging
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import redis
+from redis_utils import get_redis
+
+# hedging.py
+# Tail-latency control for LLM calls. A call that is still running after the recent p90
+# latency of its section and model gets a duplicate ("hedge"); whichever finishes first is
+# used and the other is told to stop. Hedges are only sent while the hedge budget allows:
+# at most HEDGE_BUDGET_FRACTION of the calls started in the current minute, and never more
+# than OPENAI_REQUESTS_PER_MINUTE calls in total when that limit is set.
+
+HEDGING_ENABLED = os.getenv('OPENAI_HEDGING', '1') == '1'
+HEDGE_BUDGET_FRACTION = float(os.getenv('HEDGE_BUDGET_FRACTION', 0.1))
+HEDGE_MIN_DELAY = float(os.getenv('HEDGE_MIN_DELAY', 5))  # seconds
+OPENAI_REQUESTS_PER_MINUTE = int(os.getenv('OPENAI_REQUESTS_PER_MINUTE', 0))  # 0: no limit
+
+LATENCY_HISTORY_SIZE = 50
+LATENCY_MIN_SAMPLES = 10
+BUDGET_TTL = 120  # seconds
+
+HEDGE_THREADS = int(os.getenv('HEDGE_THREADS', 32))
+
+# Calls run on these threads so the caller can wait on two of them at once; created on
+# first use in each process since threads do not survive a fork
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+def latency_key(section, model):
+    return f"par:llm_latency:{section}:{model}"
+
+def budget_key(kind, minute):
+    return f"par:llm_budget:{kind}:{minute}"
+
+def record_latency(section, model, seconds):
+    try:
+        pipe = get_redis().pipeline()
+        pipe.lpush(latency_key(section, model), round(seconds, 3))
+        pipe.ltrim(latency_key(section, model), 0, LATENCY_HISTORY_SIZE - 1)
+        pipe.execute()
+    except redis.RedisError as e:
+        logging.warning(f"Failed to record latency for {section} on {model}: {e}")
+
+def hedge_delay(section, model):
+    """Seconds to wait before hedging: the recent p90 latency, or None without enough history."""
+    try:
+        history = sorted(float(d) for d in get_redis().lrange(latency_key(section, model), 0, -1))
+    except redis.RedisError as e:
+        logging.warning(f"Failed to read latency history for {section} on {model}: {e}")
+        return None
+    if len(history) < LATENCY_MIN_SAMPLES:
+        return None
+    return max(history[int(len(history) * 0.9) - 1], HEDGE_MIN_DELAY)
+
+def count_call():
+    _incr_budget('calls')
+
+def acquire_hedge():
+    """Reserve a hedge in this minute's budget; False when it would exceed it."""
+    minute = int(time.time() // 60)
+    try:
+        pipe = get_redis().pipeline()
+        pipe.get(budget_key('calls', minute))
+        pipe.incr(budget_key('hedges', minute))
+        pipe.expire(budget_key('hedges', minute), BUDGET_TTL)
+        calls, hedges, _ = pipe.execute()
+    except redis.RedisError as e:
+        logging.warning(f"Failed to check hedge budget: {e}")
+        return False
+    calls = int(calls or 0)
+    if hedges > max(1, int(calls * HEDGE_BUDGET_FRACTION)) or (
+            OPENAI_REQUESTS_PER_MINUTE and calls + hedges > OPENAI_REQUESTS_PER_MINUTE):
+        _incr_budget('hedges', -1)
+        return False
+    return True
+
+def _incr_budget(kind, amount=1):
+    minute = int(time.time() // 60)
+    try:
+        pipe = get_redis().pipeline()
+        pipe.incrby(budget_key(kind, minute), amount)
+        pipe.expire(budget_key(kind, minute), BUDGET_TTL)
+        pipe.execute()
+    except redis.RedisError as e:
+        logging.warning(f"Failed to update hedge budget: {e}")
+
+def get_executor():
+    global _executor, _executor_pid
+    if _executor is None or _executor_pid != os.getpid():
+        with _executor_lock:
+            if _executor is None or _executor_pid != os.getpid():
+                _executor = ThreadPoolExecutor(max_workers=HEDGE_THREADS, thread_name_prefix='llm-call')
+                _executor_pid = os.getpid()
+    return _executor
+
+def _discard(future, on_discarded):
+    if future.exception() is not None:
+        return
+    try:
+        on_discarded(future.result())
+    except Exception as e:
+        logging.warning(f"Failed to handle a discarded call result: {e}")
+
+
+def hedged_call(call, deadline, delay=None, on_discarded=None):
+    """Run `call(cancelled)` within `deadline` seconds, hedging it after `delay` seconds.
+
+    `call` should return soon after its `cancelled` event is set. Results of attempts that
+    are not used (the losing attempt, or all of them past the deadline) are passed to
+    `on_discarded` once they arrive, e.g. to account for what they cost. Returns (result,
+    hedged, hedge_won). If every attempt fails the first error is raised, and
+    DeadlineExceeded if none finishes in time.
+    """
+    started = time.monotonic()
+    end = started + deadline
+    cancel_events = {}
+
+    def submit():
+        cancelled = threading.Event()
+        # Copy the caller's context so spans opened by the call nest under the caller's span
+        future = get_executor().submit(contextvars.copy_context().run, call, cancelled)
+        cancel_events[future] = cancelled
+        return future
+
+    count_call()
+    pending = {submit()}
+    hedge = None
+    error = None
+    winner = None
+    try:
+        while pending:
+            now = time.monotonic()
+            if now >= end:
+                raise DeadlineExceeded(f"No response within {deadline:g}s")
+            can_hedge = HEDGING_ENABLED and hedge is None and delay is not None
+            timeout = min(end, started + delay) - now if can_hedge else end - now
+            done, pending = wait(pending, timeout=max(timeout, 0), return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                winner = future
+                return result, hedge is not None, future is hedge
+            if not done and can_hedge and time.monotonic() >= started + delay:
+                if acquire_hedge():
+                    hedge = submit()
+                    pending.add(hedge)
+                else:
+                    delay = None
+        raise error
+    finally:
+        # Stop whichever attempt is still running
+        for future, cancelled in cancel_events.items():
+            cancelled.set()
+            if on_discarded is not None and future is not winner:
+                future.add_done_callback(lambda f: _discard(f, on_discarded))
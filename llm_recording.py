@@ -0,0 +1,94 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+# llm_recording.py
+# Record/replay of chat completion traffic (see chat_completion in adult_report_generator).
+#
+#   OPENAI_CAPTURE_MODE=record   every call is appended to OPENAI_CAPTURE_FILE as one JSON
+#                                line: request, response text, token usage and latency
+#   OPENAI_CAPTURE_MODE=replay   calls are answered from OPENAI_CAPTURE_FILE without network
+#                                access, after the recorded latency divided by
+#                                OPENAI_REPLAY_SPEED (2 = twice as fast, 0 = no delay)
+#
+# A replayed call gets the recording with the same section and messages; if the prompt has
+# changed since the capture, recordings of the same section are served in turn instead.
+# Captures contain the full prompts, i.e. patient data: keep them out of git and off
+# shared machines.
+
+CAPTURE_MODE = os.getenv('OPENAI_CAPTURE_MODE', 'off')  # 'off', 'record' or 'replay'
+CAPTURE_FILE = os.getenv('OPENAI_CAPTURE_FILE', 'llm_capture.jsonl')
+REPLAY_SPEED = float(os.getenv('OPENAI_REPLAY_SPEED', 1.0))
+
+_write_lock = threading.Lock()
+_replay_lock = threading.Lock()
+_replay_index = None
+
+
+def request_key(section, messages):
+    payload = json.dumps({'section': section, 'messages': messages}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def record_call(section, model, request, content, finish_reason, usage, latency):
+    record = {
+        'recorded_at': time.time(),
+        'key': request_key(section, request.get('messages')),
+        'section': section,
+        'model': model,
+        'request': request,
+        'response': {'content': content, 'finish_reason': finish_reason},
+        'usage': usage,
+        'latency': round(latency, 3),
+    }
+    line = json.dumps(record) + '\n'
+    try:
+        # One write per line in append mode, so concurrent workers do not interleave records
+        with _write_lock, open(CAPTURE_FILE, 'a') as f:
+            f.write(line)
+    except OSError as e:
+        logging.warning(f"Failed to record chat completion for {section}: {e}")
+
+
+class ReplayIndex:
+    def __init__(self, path):
+        self.by_key = {}
+        self.by_section = {}
+        self.cursors = {}
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    self.by_key.setdefault(record['key'], []).append(record)
+                    self.by_section.setdefault(record['section'], []).append(record)
+
+    def _next(self, name, records):
+        # Cycle through the candidates so repeated calls replay different recordings
+        cursor = self.cursors.get(name, 0)
+        self.cursors[name] = cursor + 1
+        return records[cursor % len(records)]
+
+    def find(self, section, messages):
+        key = request_key(section, messages)
+        if key in self.by_key:
+            return self._next(key, self.by_key[key])
+        if section in self.by_section:
+            return self._next(section, self.by_section[section])
+        return None
+
+
+def replay_call(section, messages):
+    """The recording to answer this call with, after waiting its (scaled) original latency."""
+    global _replay_index
+    with _replay_lock:
+        if _replay_index is None:
+            _replay_index = ReplayIndex(CAPTURE_FILE)
+        record = _replay_index.find(section, messages)
+    if record is None:
+        raise LookupError(f"No recorded chat completion for section {section} in {CAPTURE_FILE}")
+    if REPLAY_SPEED > 0:
+        time.sleep(record['latency'] / REPLAY_SPEED)
+    return record
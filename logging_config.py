@@ -0,0 +1,193 @@
+import os
+import re
+import sys
+import json
+import time
+import queue
+import atexit
+import logging
+import threading
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from tracing import current_span
+from process_files import process_file
+
+# logging_config.py
+# Logging for the web and worker processes. Loggers only put records on an in-memory
+# queue; a background QueueListener thread formats them as JSON and does all file and
+# console I/O, so rotation and disk writes never happen on a request or task thread.
+#
+# Each process writes and rotates (LOG_MAX_BYTES, LOG_BACKUP_COUNT) its own file,
+# app.log -> app.{pid}.log (see process_files); stderr carries the records of all of them.
+
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+LOG_MAX_MESSAGE_CHARS = int(os.getenv('LOG_MAX_MESSAGE_CHARS', 500))
+LOG_RATE_LIMIT = int(os.getenv('LOG_RATE_LIMIT', 20))  # INFO/DEBUG lines per call site per interval
+LOG_RATE_INTERVAL = float(os.getenv('LOG_RATE_INTERVAL', 60))
+LOG_QUEUE_SIZE = 10000
+
+# Patterns that look like patient identifiers; masked before a record leaves the process
+PHI_PATTERNS = [
+    (re.compile(r'\b\d{3}-\d{2}-\d{4}\b'), '[SSN]'),
+    (re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+'), '[EMAIL]'),
+    (re.compile(r'\(?\b\d{3}\)?[-. ]\d{3}[-. ]\d{4}\b'), '[PHONE]'),
+    (re.compile(r'\b\d{1,2}/\d{1,2}/\d{2,4}\b'), '[DATE]'),
+]
+
+_listeners = {}
+_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'func': record.funcName,
+            'line': record.lineno,
+            'pid': record.process,
+        }
+        for key in ('trace_id', 'span_id', 'session_id', 'suppressed'):
+            value = getattr(record, key, None)
+            if value is not None:
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_type'] = record.exc_info[0].__name__
+        return json.dumps(entry)
+
+
+class RedactFilter(logging.Filter):
+    """Truncate long messages and mask identifier-like strings so assessment text never reaches disk."""
+
+    def filter(self, record):
+        message = record.getMessage()
+        if len(message) > LOG_MAX_MESSAGE_CHARS:
+            message = message[:LOG_MAX_MESSAGE_CHARS] + f"... [{len(message) - LOG_MAX_MESSAGE_CHARS} chars truncated]"
+        for pattern, replacement in PHI_PATTERNS:
+            message = pattern.sub(replacement, message)
+        record.msg = message
+        record.args = None
+        # Tracebacks can quote arguments verbatim; keep only the exception type
+        if record.exc_info:
+            record.exc_text = None
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Let at most `limit` INFO/DEBUG records per call site through every `interval` seconds.
+
+    Warnings and errors always pass. The next record let through from a call site
+    carries the number of records dropped in between as `suppressed`.
+    """
+
+    def __init__(self, limit=LOG_RATE_LIMIT, interval=LOG_RATE_INTERVAL):
+        super().__init__()
+        self.limit = limit
+        self.interval = interval
+        self.windows = {}
+        self.lock = threading.Lock()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.limit <= 0:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self.lock:
+            window_start, count, suppressed = self.windows.get(key, (now, 0, 0))
+            if now - window_start >= self.interval:
+                window_start, count = now, 0
+            if count >= self.limit:
+                self.windows[key] = (window_start, count, suppressed + 1)
+                return False
+            self.windows[key] = (window_start, count + 1, 0)
+        if suppressed:
+            record.suppressed = suppressed
+        return True
+
+
+class TraceContextFilter(logging.Filter):
+    def filter(self, record):
+        span = current_span()
+        if span is not None:
+            record.trace_id = span.trace_id
+            record.span_id = span.span_id
+            if 'session_id' in span.attributes and not hasattr(record, 'session_id'):
+                record.session_id = span.attributes['session_id']
+        return True
+
+
+def _start_listener(log_file):
+    log_queue = queue.Queue(LOG_QUEUE_SIZE)
+    formatter = JsonFormatter()
+
+    file_handler = RotatingFileHandler(process_file(log_file), maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+    file_handler.setFormatter(formatter)
+    console_handler = logging.StreamHandler(sys.stderr)
+    console_handler.setFormatter(formatter)
+
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+    return log_queue, listener
+
+def _get_log_queue(log_file):
+    # The writer thread is started by the first record, not at import, and once per
+    # process: threads do not survive fork (Celery prefork, gunicorn preload)
+    key = (os.getpid(), log_file)
+    entry = _listeners.get(key)
+    if entry is None:
+        with _lock:
+            entry = _listeners.get(key)
+            if entry is None:
+                entry = _listeners[key] = _start_listener(log_file)
+    return entry[0]
+
+
+class _LazyQueueHandler(QueueHandler):
+    def __init__(self, log_file):
+        super().__init__(None)
+        self.log_file = log_file
+
+    def enqueue(self, record):
+        # Never block the caller: drop the record if the writer thread has fallen behind
+        try:
+            _get_log_queue(self.log_file).put_nowait(record)
+        except queue.Full:
+            pass
+
+    def prepare(self, record):
+        # Format the message on the caller's thread (args may be mutable), but leave
+        # JSON serialization and I/O to the listener
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        return record
+
+
+def configure_logging(logger, log_file, level=None):
+    """Route `logger` through a background writer thread for `log_file`. Safe to call repeatedly."""
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    handler = _LazyQueueHandler(log_file)
+    handler.addFilter(RateLimitFilter())
+    handler.addFilter(TraceContextFilter())
+    handler.addFilter(RedactFilter())
+    logger.addHandler(handler)
+    logger.setLevel(level or LOG_LEVEL)
+    logger.propagate = False
+    return logger
+
+
+def _stop_listeners():
+    for key, (_, listener) in list(_listeners.items()):
+        if key[0] == os.getpid():
+            try:
+                listener.stop()
+            except Exception:
+                pass
+
+
+atexit.register(_stop_listeners)
@@ -0,0 +1,110 @@
+import os
+import logging
+import resource
+import tracemalloc
+
+# memory_profile.py
+# Memory instrumentation and guardrails for report workers.
+#
+# MEMORY_PROFILING=1 (opt-in, tracemalloc slows Python down noticeably) adds a `memory` entry
+# to every completed stage in the progress snapshot and task metadata: RSS before and after
+# the stage, the process peak RSS so far, the peak of Python allocations during the stage and
+# the lines that allocated the most.
+#
+# WORKER_MEMORY_CEILING_MB makes a report shed input rather than get the worker OOM-killed:
+# once RSS passes the ceiling, raw PDFs are parsed and dropped as soon as they are downloaded,
+# and the extracted texts handed to a prompt are truncated to MEMORY_SHED_FRACTION of their
+# size. MAX_INPUT_CHARS caps the texts of one prompt regardless of memory.
+
+MEMORY_PROFILING = os.getenv('MEMORY_PROFILING', '0') == '1'
+MEMORY_TOP_ALLOCATIONS = int(os.getenv('MEMORY_TOP_ALLOCATIONS', 5))
+MEMORY_CEILING_MB = float(os.getenv('WORKER_MEMORY_CEILING_MB', 0))  # 0: no ceiling
+MEMORY_SHED_FRACTION = float(os.getenv('MEMORY_SHED_FRACTION', 0.5))
+MAX_INPUT_CHARS = int(os.getenv('MAX_INPUT_CHARS', 0))  # 0: no cap
+
+TRUNCATION_MARKER = "\n\n[... {chars} characters omitted ...]\n\n"
+
+_PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+def rss_mb():
+    """Current resident set size; falls back to the peak where /proc is unavailable."""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE / 2**20
+    except (OSError, IndexError, ValueError):
+        return peak_rss_mb()
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def over_ceiling():
+    return bool(MEMORY_CEILING_MB) and rss_mb() > MEMORY_CEILING_MB
+
+
+class StageMemory:
+    """Memory used by one pipeline stage; only measures when MEMORY_PROFILING is on."""
+
+    def __init__(self):
+        self.rss_start = None
+        if not MEMORY_PROFILING:
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self.rss_start = rss_mb()
+
+    def finish(self):
+        if self.rss_start is None:
+            return None
+        _, traced_peak = tracemalloc.get_traced_memory()
+        top = tracemalloc.take_snapshot().statistics('lineno')[:MEMORY_TOP_ALLOCATIONS]
+        return {
+            'rss_start_mb': round(self.rss_start, 1),
+            'rss_end_mb': round(rss_mb(), 1),
+            'process_peak_rss_mb': round(peak_rss_mb(), 1),
+            'traced_peak_mb': round(traced_peak / 2**20, 1),
+            'top_allocations': [
+                {'location': f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", 'mb': round(stat.size / 2**20, 2)}
+                for stat in top
+            ],
+        }
+
+
+def truncate_text(text, max_chars):
+    """Keep the beginning and end of `text` within `max_chars`, marking what was cut."""
+    if len(text) <= max_chars:
+        return text
+    head = max_chars * 2 // 3
+    tail = max_chars - head
+    return text[:head] + TRUNCATION_MARKER.format(chars=len(text) - max_chars) + (text[-tail:] if tail else '')
+
+def shed_inputs(texts):
+    """Apply MAX_INPUT_CHARS and, above the memory ceiling, MEMORY_SHED_FRACTION to `texts`.
+
+    The longest texts are cut first, down to a common length, so short score reports survive
+    intact. Returns (texts, {name: characters removed}).
+    """
+    total = sum(len(text) for text in texts.values())
+    budget = MAX_INPUT_CHARS or total
+    if over_ceiling():
+        budget = min(budget, int(total * MEMORY_SHED_FRACTION))
+        logging.warning(f"RSS {rss_mb():.0f} MB is above the {MEMORY_CEILING_MB:.0f} MB ceiling, shedding input to {budget} characters")
+    if total <= budget:
+        return texts, {}
+
+    # Largest per-text length that keeps the total within budget
+    lengths = sorted(len(text) for text in texts.values())
+    remaining, limit = budget, 0
+    for i, length in enumerate(lengths):
+        share = remaining // (len(lengths) - i)
+        if length > share:
+            limit = share
+            break
+        remaining -= length
+    else:
+        return texts, {}
+
+    shed = {name: len(text) - limit for name, text in texts.items() if len(text) > limit}
+    return {name: truncate_text(text, limit) for name, text in texts.items()}, shed
@@ -0,0 +1,140 @@
+import time
+import logging
+from contextlib import contextmanager
+import redis
+from redis_utils import get_redis, get_broker_redis
+
+# metrics.py
+# Counters and histograms aggregated in Redis so every web and Celery worker process,
+# on any dyno, contributes to the same series. /metrics renders them in the
+# Prometheus text exposition format.
+
+METRICS_PREFIX = 'par:metrics'
+
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300, 600)
+
+# name -> (type, help, buckets)
+METRICS = {
+    'par_stage_duration_seconds': ('histogram', 'Duration of each report pipeline stage.', DURATION_BUCKETS),
+    'par_section_duration_seconds': ('histogram', 'Duration of each report section, including LLM latency.', DURATION_BUCKETS),
+    'par_openai_request_duration_seconds': ('histogram', 'Latency of individual chat completion calls.', DURATION_BUCKETS),
+    'par_s3_download_duration_seconds': ('histogram', 'Duration of individual S3 downloads in the worker.', DURATION_BUCKETS),
+    'par_pdf_extract_duration_seconds': ('histogram', 'Duration of PyPDF2 text extraction per file.', DURATION_BUCKETS),
+    'par_queue_wait_seconds': ('histogram', 'Time from enqueue to task start.', DURATION_BUCKETS),
+    'par_report_duration_seconds': ('histogram', 'Total task duration per report.', DURATION_BUCKETS),
+    'par_openai_requests_total': ('counter', 'Chat completion calls by section route, model and outcome (ok, fallback, error).', None),
+    'par_openai_hedges_total': ('counter', 'Chat completion calls that were hedged, by which attempt finished first.', None),
+    'par_openai_connections_total': ('counter', 'Chat completion HTTP requests by whether they opened a new connection or reused a pooled one.', None),
+    'par_openai_connect_duration_seconds': ('histogram', 'TCP and TLS setup time of new OpenAI connections.', DURATION_BUCKETS),
+    'par_openai_tokens_total': ('counter', 'Tokens used by chat completion calls; discarded="true" for unused hedge attempts.', None),
+    'par_openai_cost_usd_total': ('counter', 'Estimated chat completion cost in US dollars; discarded="true" for unused hedge attempts.', None),
+    'par_reports_total': ('counter', 'Reports processed, by outcome.', None),
+    'par_upload_dedup_total': ('counter', 'Uploaded files by whether their content was already stored (hit) or not (miss).', None),
+    'par_upload_dedup_bytes_total': ('counter', 'Bytes of uploaded files by whether their content was already stored.', None),
+    'par_text_sidecar_total': ('counter', 'Lookups and writes of extracted-text sidecars (hit, miss, written).', None),
+    'par_input_read_bytes_total': ('counter', 'Bytes workers read to get input text, from sidecars or raw PDFs.', None),
+    'par_storage_objects': ('gauge', 'S3 objects per artifact kind at the last retention run.', None),
+    'par_storage_bytes': ('gauge', 'S3 bytes per artifact kind at the last retention run.', None),
+    'par_retention_deleted_objects_total': ('counter', 'S3 objects deleted by the retention job, by artifact kind.', None),
+    'par_retention_deleted_bytes_total': ('counter', 'S3 bytes deleted by the retention job, by artifact kind.', None),
+    'par_local_storage_bytes': ('gauge', 'Bytes under each local working folder at the last retention run.', None),
+    'par_redis_used_memory_bytes': ('gauge', 'Redis used_memory at the last retention run.', None),
+}
+
+# USD per one million tokens: (prompt, completion)
+MODEL_PRICES = {
+    'gpt-4o-mini': (0.15, 0.60),
+    'gpt-4o': (2.50, 10.00),
+}
+
+def _key(name):
+    return f"{METRICS_PREFIX}:{name}"
+
+def _label_str(labels):
+    return ','.join(f'{k}="{v}"' for k, v in sorted(labels.items()))
+
+def inc(name, value=1, **labels):
+    try:
+        get_redis().hincrbyfloat(_key(name), _label_str(labels), value)
+    except redis.RedisError as e:
+        logging.warning(f"Failed to record metric {name}: {e}")
+
+def observe(name, value, **labels):
+    buckets = METRICS[name][2]
+    label_str = _label_str(labels)
+    try:
+        pipe = get_redis().pipeline(transaction=False)
+        for bucket in buckets:
+            if value <= bucket:
+                pipe.hincrby(_key(name), f"{label_str}|{bucket}", 1)
+        pipe.hincrby(_key(name), f"{label_str}|+Inf", 1)
+        pipe.hincrby(_key(name), f"{label_str}|count", 1)
+        pipe.hincrbyfloat(_key(name), f"{label_str}|sum", value)
+        pipe.execute()
+    except redis.RedisError as e:
+        logging.warning(f"Failed to record metric {name}: {e}")
+
+def set_gauge(name, value, **labels):
+    try:
+        get_redis().hset(_key(name), _label_str(labels), value)
+    except redis.RedisError as e:
+        logging.warning(f"Failed to record metric {name}: {e}")
+
+@contextmanager
+def timed(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start, **labels)
+
+def record_token_cost(section, model, prompt_tokens, completion_tokens, **labels):
+    inc('par_openai_tokens_total', prompt_tokens, section=section, model=model, kind='prompt', **labels)
+    inc('par_openai_tokens_total', completion_tokens, section=section, model=model, kind='completion', **labels)
+    prices = MODEL_PRICES.get(model)
+    if prices:
+        cost = (prompt_tokens * prices[0] + completion_tokens * prices[1]) / 1_000_000
+        inc('par_openai_cost_usd_total', cost, section=section, model=model, **labels)
+
+def _format_series(name, label_str, extra=''):
+    labels = ','.join(part for part in (label_str, extra) if part)
+    return f"{name}{{{labels}}}" if labels else name
+
+def render_queue_depth(queues):
+    """Gauge lines for the number of tasks waiting in each Celery queue (a Redis list per queue)."""
+    lines = ["# HELP par_queue_depth Tasks waiting in each Celery queue.", "# TYPE par_queue_depth gauge"]
+    try:
+        pipe = get_broker_redis().pipeline(transaction=False)
+        for queue in queues:
+            pipe.llen(queue)
+        for queue, depth in zip(queues, pipe.execute()):
+            lines.append(f'par_queue_depth{{queue="{queue}"}} {depth}')
+    except redis.RedisError as e:
+        logging.warning(f"Failed to read queue depth: {e}")
+    return '\n'.join(lines) + '\n'
+
+def render_metrics():
+    """Render every metric stored in Redis in the Prometheus text format."""
+    pipe = get_redis().pipeline(transaction=False)
+    for name in METRICS:
+        pipe.hgetall(_key(name))
+    values = pipe.execute()
+
+    lines = []
+    for (name, (metric_type, help_text, buckets)), series in zip(METRICS.items(), values):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        if metric_type in ('counter', 'gauge'):
+            for label_str, value in sorted(series.items()):
+                lines.append(f"{_format_series(name, label_str)} {float(value)}")
+            continue
+
+        label_sets = sorted({field.rsplit('|', 1)[0] for field in series})
+        for label_str in label_sets:
+            for bucket in list(buckets) + ['+Inf']:
+                count = series.get(f"{label_str}|{bucket}", 0)
+                le = f'le="{bucket}"'
+                lines.append(f"{_format_series(name + '_bucket', label_str, le)} {int(count)}")
+            lines.append(f"{_format_series(name + '_count', label_str)} {int(series.get(f'{label_str}|count', 0))}")
+            lines.append(f"{_format_series(name + '_sum', label_str)} {float(series.get(f'{label_str}|sum', 0))}")
+    return '\n'.join(lines) + '\n'
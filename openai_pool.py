@@ -0,0 +1,118 @@
+import os
+import time
+import logging
+import threading
+import httpx
+from openai import OpenAI, OpenAIError, DefaultHttpxClient
+from config import config
+from celery_config import CELERY_POOL, CELERY_CONCURRENCY, POOL_CONCURRENCY
+from hedging import HEDGING_ENABLED
+from llm_recording import CAPTURE_MODE
+from metrics import inc, observe
+
+# openai_pool.py
+# The OpenAI client of a worker process and its HTTP connection pool.
+#
+# The client is created on first use in each process, never inherited through a fork, and
+# keeps up to OPENAI_POOL_SIZE connections alive for OPENAI_KEEPALIVE_SECONDS between calls.
+# The default size covers every call a process can have in flight: one per task slot of the
+# pool (CELERY_POOL, CELERY_CONCURRENCY), and with hedging on two more per slot: the hedge,
+# and a cancelled attempt that is still holding its connection. A cancelled stream only
+# notices between chunks, so one that has stalled keeps its connection until its timeout.
+#
+# Workers open OPENAI_PREWARM_CONNECTIONS connections when they start (see the worker
+# signals in adult_report_generator), so the first section of a task does not wait for a
+# TCP and TLS handshake. Every request counts whether it reused a pooled connection in
+# par_openai_connections_total; new connections record their setup time in
+# par_openai_connect_duration_seconds.
+
+OPENAI_KEEPALIVE_SECONDS = float(os.getenv('OPENAI_KEEPALIVE_SECONDS', 60))
+OPENAI_PREWARM_CONNECTIONS = int(os.getenv('OPENAI_PREWARM_CONNECTIONS', 2))
+PREWARM_TIMEOUT = 10  # seconds
+
+TRACE_EXTENSION = 'par_connection'
+
+_client = None
+_client_pid = None
+_client_lock = threading.Lock()
+_prewarmed_pid = None
+
+
+def default_pool_size():
+    # Prefork children run one task at a time; thread and green pools run many per process
+    tasks = 1 if CELERY_POOL == 'prefork' else (CELERY_CONCURRENCY or POOL_CONCURRENCY.get(CELERY_POOL) or 1)
+    return tasks * (3 if HEDGING_ENABLED else 1)
+
+OPENAI_POOL_SIZE = int(os.getenv('OPENAI_POOL_SIZE', 0)) or default_pool_size()
+
+
+def _trace_connection(request):
+    # httpcore reports connection setup through the `trace` extension; it only fires
+    # connect events when the request opens a new connection
+    state = {'started': None, 'ready': None}
+
+    def trace(event, info):
+        if event == 'connection.connect_tcp.started':
+            state['started'] = time.perf_counter()
+        elif event in ('connection.connect_tcp.complete', 'connection.start_tls.complete'):
+            state['ready'] = time.perf_counter()
+
+    request.extensions['trace'] = trace
+    request.extensions[TRACE_EXTENSION] = state
+
+def _record_connection(response):
+    state = response.request.extensions.get(TRACE_EXTENSION)
+    if state is None:
+        return
+    if state['started'] is None:
+        inc('par_openai_connections_total', result='reused')
+        return
+    inc('par_openai_connections_total', result='new')
+    if state['ready'] is not None:
+        observe('par_openai_connect_duration_seconds', state['ready'] - state['started'])
+
+
+def get_openai_client():
+    global _client, _client_pid
+    # Rebuilt after fork: the HTTP connection pool of a client created in the
+    # Celery parent process must not be shared with its children
+    if _client is None or _client_pid != os.getpid():
+        with _client_lock:
+            if _client is None or _client_pid != os.getpid():
+                http_client = DefaultHttpxClient(
+                    limits=httpx.Limits(
+                        max_connections=OPENAI_POOL_SIZE,
+                        max_keepalive_connections=OPENAI_POOL_SIZE,
+                        keepalive_expiry=OPENAI_KEEPALIVE_SECONDS,
+                    ),
+                    event_hooks={'request': [_trace_connection], 'response': [_record_connection]},
+                )
+                _client = OpenAI(
+                    api_key=os.getenv("OPENAI_API_KEY"),
+                    timeout=config.OPENAI_TIMEOUT,
+                    max_retries=config.OPENAI_MAX_RETRIES,
+                    http_client=http_client,
+                )
+                _client_pid = os.getpid()
+    return _client
+
+
+def prewarm(connections=OPENAI_PREWARM_CONNECTIONS):
+    """Open `connections` pooled connections in the background; once per process."""
+    global _prewarmed_pid
+    if _prewarmed_pid == os.getpid() or connections <= 0 or CAPTURE_MODE == 'replay' or not os.getenv('OPENAI_API_KEY'):
+        return
+    _prewarmed_pid = os.getpid()
+    client = get_openai_client().with_options(max_retries=0, timeout=PREWARM_TIMEOUT)
+
+    def warm():
+        # A cheap authenticated request; the connection stays in the pool afterwards
+        try:
+            client.models.list()
+        except OpenAIError as e:
+            logging.warning(f"Failed to prewarm an OpenAI connection: {e}")
+
+    # Concurrent requests, so each one opens its own connection
+    for _ in range(min(connections, OPENAI_POOL_SIZE)):
+        threading.Thread(target=warm, name='openai-prewarm', daemon=True).start()
+    logging.info(f"Prewarming {min(connections, OPENAI_POOL_SIZE)} OpenAI connections (pool size {OPENAI_POOL_SIZE})")
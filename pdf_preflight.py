@@ -0,0 +1,89 @@
+import os
+
+# pdf_preflight.py
+# Cheap checks of an uploaded PDF before anything parses its content streams. PdfReader
+# only reads the cross-reference table, the trailer and the page tree here, so a large
+# scan costs about as much as a one-page form.
+#
+#   PDF_MAX_MB, PDF_MAX_PAGES   uploads above either limit are rejected; workers that get
+#                               one anyway (e.g. from a batch job) extract only the first
+#                               PDF_MAX_PAGES pages and flag the input in the progress data
+#   PDF_SLOW_PAGES              pipelined extraction of longer files, and of image-only
+#                               files (scans without a text layer), runs on the '.slow'
+#                               queue so it cannot hold up other reports' extraction
+#
+# Pages without a text layer are skipped during extraction: PyPDF2 has no OCR and
+# returns nothing for them.
+
+PDF_MAX_MB = float(os.getenv('PDF_MAX_MB', 50))
+PDF_MAX_PAGES = int(os.getenv('PDF_MAX_PAGES', 500))
+PDF_SLOW_PAGES = int(os.getenv('PDF_SLOW_PAGES', 150))
+
+
+class PreflightError(ValueError):
+    pass
+
+
+def _resolved(obj):
+    return obj.get_object() if obj is not None else None
+
+def page_has_text_layer(page):
+    """Whether the page's resources include a font, directly or in a form XObject."""
+    resources = _resolved(page.get('/Resources'))
+    if not resources:
+        return False
+    if '/Font' in resources:
+        return True
+    xobjects = _resolved(resources.get('/XObject')) or {}
+    for xobject in xobjects.values():
+        xobject = _resolved(xobject)
+        if xobject.get('/Subtype') == '/Form' and '/Font' in (_resolved(xobject.get('/Resources')) or {}):
+            return True
+    return False
+
+def page_has_images(page):
+    resources = _resolved(page.get('/Resources')) or {}
+    xobjects = _resolved(resources.get('/XObject')) or {}
+    return any(_resolved(xobject).get('/Subtype') == '/Image' for xobject in xobjects.values())
+
+
+def preflight_pdf(fileobj):
+    """Size, page count and text layer of a PDF file object; leaves it at position 0.
+
+    Raises PreflightError for files that cannot be read as a PDF.
+    """
+    from PyPDF2 import PdfReader
+
+    fileobj.seek(0, os.SEEK_END)
+    size = fileobj.tell()
+    fileobj.seek(0)
+    try:
+        reader = PdfReader(fileobj, strict=False)
+        if reader.is_encrypted:
+            raise PreflightError("the PDF is encrypted")
+        pages = reader.pages
+        text_pages = sum(1 for page in pages if page_has_text_layer(page))
+        image_pages = sum(1 for page in pages if page_has_images(page))
+        info = {'bytes': size, 'pages': len(pages), 'text_pages': text_pages, 'image_pages': image_pages}
+    except PreflightError:
+        raise
+    except Exception as e:
+        raise PreflightError(f"not a readable PDF ({e})") from e
+    finally:
+        fileobj.seek(0)
+    return info
+
+def limit_problems(info):
+    """Reasons the file is over the configured limits; empty when it is within them."""
+    problems = []
+    if info['bytes'] > PDF_MAX_MB * 2**20:
+        problems.append(f"{info['bytes'] / 2**20:.1f} MB is over the {PDF_MAX_MB:g} MB limit")
+    if info['pages'] > PDF_MAX_PAGES:
+        problems.append(f"{info['pages']} pages is over the {PDF_MAX_PAGES} page limit")
+    return problems
+
+def is_image_only(info):
+    return info['text_pages'] == 0 and info['image_pages'] > 0
+
+def needs_slow_path(info):
+    return is_image_only(info) or info['pages'] > PDF_SLOW_PAGES
@@ -0,0 +1,31 @@
+import os
+import re
+
+# process_files.py
+# Files written by one process each. gunicorn and Celery run several processes that log and
+# export traces to the same configured path; a RotatingFileHandler in each of them would
+# rename the shared file under the others. Instead every process writes and rotates its own
+# file, with its pid before the extension (app.log -> app.1234.log, rotated to
+# app.1234.log.1, ...). Readers (tracing's waterfall) and retention list them all.
+
+
+def process_file(path, pid=None):
+    """The file process `pid` (default: this one) writes to in place of `path`."""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{pid or os.getpid()}{ext}"
+
+def process_files(path):
+    """(path, pid, is_backup) of every per-process file of `path` and its rotated backups."""
+    folder = os.path.dirname(path) or '.'
+    root, ext = os.path.splitext(os.path.basename(path))
+    pattern = re.compile(rf"{re.escape(root)}\.(\d+){re.escape(ext)}(\.\d+)?$")
+    try:
+        names = os.listdir(folder)
+    except OSError:
+        return []
+    files = []
+    for name in sorted(names):
+        match = pattern.match(name)
+        if match:
+            files.append((os.path.join(folder, name), int(match.group(1)), match.group(2) is not None))
+    return files
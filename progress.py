@@ -0,0 +1,368 @@
+import json
+import time
+import logging
+import statistics
+import threading
+import redis
+from redis_utils import get_redis
+from metrics import observe, inc
+from memory_profile import StageMemory
+
+# progress.py
+# Per-session progress events, published by the report task over Redis pub/sub
+# and replayed from a short list so a browser that connects late still catches up.
+
+PROGRESS_LOG_TTL = 3600  # seconds
+FINAL_EVENTS = {'complete', 'error'}
+FINAL_STATES = {'SUCCESS', 'FAILURE'}
+
+def progress_channel(session_id):
+    return f"par:progress:{session_id}"
+
+def progress_log_key(session_id):
+    return f"par:progress_log:{session_id}"
+
+def progress_seq_key(session_id):
+    return f"par:progress_seq:{session_id}"
+
+def publish_progress(session_id, event, **data):
+    """Publish a progress event for a session. Never raises: progress is best effort."""
+    try:
+        r = get_redis()
+        seq = r.incr(progress_seq_key(session_id))
+        message = json.dumps({'seq': seq, 'event': event, 'session_id': session_id, 'ts': time.time(), **data})
+        pipe = r.pipeline()
+        pipe.rpush(progress_log_key(session_id), message)
+        pipe.expire(progress_log_key(session_id), PROGRESS_LOG_TTL)
+        pipe.expire(progress_seq_key(session_id), PROGRESS_LOG_TTL)
+        pipe.publish(progress_channel(session_id), message)
+        pipe.execute()
+    except redis.RedisError as e:
+        logging.warning(f"Failed to publish progress event {event} for session {session_id}: {e}")
+
+def get_progress_events(session_id):
+    try:
+        return [json.loads(m) for m in get_redis().lrange(progress_log_key(session_id), 0, -1)]
+    except redis.RedisError as e:
+        logging.warning(f"Failed to read progress log for session {session_id}: {e}")
+        return []
+
+def stream_progress(session_id, timeout=25, heartbeat=15, last_seq=0):
+    """Yield progress events for a session: first the replayed log, then live pub/sub messages.
+
+    Events up to `last_seq` (the Last-Event-ID of a reconnecting browser) are not replayed.
+    Yields None on every heartbeat interval without a message so the caller can keep the
+    connection alive. Stops after a final event or once `timeout` seconds have passed.
+    """
+    pubsub = get_redis().pubsub(ignore_subscribe_messages=True)
+    # Subscribe before replaying the log so no event published in between is lost
+    pubsub.subscribe(progress_channel(session_id))
+    try:
+        for event in get_progress_events(session_id):
+            if event['seq'] <= last_seq:
+                continue
+            last_seq = event['seq']
+            yield event
+            if event['event'] in FINAL_EVENTS:
+                return
+
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            message = pubsub.get_message(timeout=min(heartbeat, max(deadline - time.monotonic(), 0)))
+            if message is None:
+                yield None
+                continue
+            event = json.loads(message['data'])
+            if event['seq'] <= last_seq:
+                continue
+            last_seq = event['seq']
+            yield event
+            if event['event'] in FINAL_EVENTS:
+                return
+    finally:
+        pubsub.close()
+
+
+# Stage tracking: the report task reports its current stage through Celery task state,
+# a status snapshot in Redis (readable without the task id) and the progress events above.
+
+STATUS_TTL = 86400  # seconds
+STAGE_HISTORY_SIZE = 50
+
+_local = threading.local()
+
+def status_key(session_id):
+    return f"par:status:{session_id}"
+
+def stage_history_key(stage):
+    return f"par:stage_durations:{stage}"
+
+def set_status(session_id, status):
+    try:
+        get_redis().set(status_key(session_id), json.dumps(status), ex=STATUS_TTL)
+    except redis.RedisError as e:
+        logging.warning(f"Failed to store status for session {session_id}: {e}")
+
+def get_status(session_id):
+    try:
+        status = get_redis().get(status_key(session_id))
+        return json.loads(status) if status else None
+    except redis.RedisError as e:
+        logging.warning(f"Failed to read status for session {session_id}: {e}")
+        return None
+
+def has_failed(session_id):
+    return (get_status(session_id) or {}).get('state') == 'FAILURE'
+
+def started_key(session_id):
+    return f"par:started:{session_id}"
+
+def mark_queued(session_id, queue=None):
+    """Record the enqueue time so queue wait can be told apart from processing time."""
+    try:
+        # A new run of the session: its first tracker starts it again
+        get_redis().delete(started_key(session_id))
+    except redis.RedisError as e:
+        logging.warning(f"Failed to clear start of session {session_id}: {e}")
+    set_status(session_id, {'session_id': session_id, 'state': 'QUEUED', 'queue': queue, 'enqueued_at': time.time(), 'updated_at': time.time()})
+
+def claim_start(session_id, started_at):
+    """Record `started_at` as the start of the report unless another tracker already has.
+
+    Returns (start time of the report, whether this call claimed it). SET NX makes exactly one
+    of several trackers starting at once the winner.
+    """
+    try:
+        r = get_redis()
+        if r.set(started_key(session_id), started_at, nx=True, ex=STATUS_TTL):
+            return started_at, True
+        claimed_at = r.get(started_key(session_id))
+        return (float(claimed_at) if claimed_at else started_at), False
+    except redis.RedisError as e:
+        logging.warning(f"Failed to claim start of session {session_id}: {e}")
+        return started_at, True
+
+def record_stage_duration(stage, duration):
+    try:
+        pipe = get_redis().pipeline()
+        pipe.lpush(stage_history_key(stage), round(duration, 3))
+        pipe.ltrim(stage_history_key(stage), 0, STAGE_HISTORY_SIZE - 1)
+        pipe.execute()
+    except redis.RedisError as e:
+        logging.warning(f"Failed to record duration for stage {stage}: {e}")
+
+def get_typical_durations(stages):
+    """Return the median of recent durations for each stage that has any history."""
+    try:
+        pipe = get_redis().pipeline()
+        for stage in stages:
+            pipe.lrange(stage_history_key(stage), 0, -1)
+        histories = pipe.execute()
+    except redis.RedisError as e:
+        logging.warning(f"Failed to read stage duration history: {e}")
+        return {}
+    return {stage: statistics.median(float(d) for d in history) for stage, history in zip(stages, histories) if history}
+
+def completed_stages_key(session_id):
+    return f"par:stages_done:{session_id}"
+
+def tokens_key(session_id):
+    return f"par:tokens:{session_id}"
+
+def record_token_usage(tokens):
+    """Add tokens to the report currently being generated in this thread, if any."""
+    tracker = getattr(_local, 'tracker', None)
+    if tracker is not None and tokens:
+        tracker.add_tokens(tokens)
+
+def _flatten(planned_stages):
+    return [stage for step in planned_stages for stage in (step if isinstance(step, tuple) else (step,))]
+
+class ReportProgress:
+    """Tracks which stage of a report a task is in and publishes it on every transition.
+
+    A report may be worked on by several tasks, some in parallel (see report_workflow), so
+    completed stages and token counts live in Redis and every tracker for the same session
+    publishes the whole picture. The first tracker for a queued report starts it (see
+    claim_start); later ones resume it. A report that already succeeded or failed stays that way: trackers of its
+    late tasks neither reset it nor publish progress.
+
+    `planned_stages` is the ordered list of stage keys; an entry may be a tuple of stages that
+    run in parallel. The ETA adds, for each step still ahead, the longest historical median
+    duration among its unfinished stages.
+    """
+
+    def __init__(self, session_id, planned_stages, task=None, queue=None):
+        self.session_id = session_id
+        self.planned_stages = list(planned_stages)
+        self.task = task
+        status = get_status(session_id) or {}
+        self.enqueued_at = status.get('enqueued_at')
+        self.queue = queue or status.get('queue')
+        self.finished = status.get('state') in FINAL_STATES
+        if self.finished:
+            self.started_at = status.get('started_at') or time.time()
+        else:
+            self.started_at, claimed = claim_start(session_id, time.time())
+            if claimed:
+                self._reset_shared_state()
+                if self.enqueued_at:
+                    observe('par_queue_wait_seconds', max(self.started_at - self.enqueued_at, 0), queue=self.queue or 'unknown')
+        self.tokens = 0
+        self.stage = None
+        self.stage_started_at = None
+        self.stage_memory = None
+        self.stage_data = {}
+        self.stage_flags = {}
+        self.typical_durations = get_typical_durations(_flatten(self.planned_stages))
+        _local.tracker = self
+
+    def _reset_shared_state(self):
+        try:
+            get_redis().delete(completed_stages_key(self.session_id), tokens_key(self.session_id))
+        except redis.RedisError as e:
+            logging.warning(f"Failed to reset progress for session {self.session_id}: {e}")
+
+    def _shared_state(self):
+        """Return (completed stages, total tokens) for the whole report."""
+        try:
+            pipe = get_redis().pipeline()
+            pipe.lrange(completed_stages_key(self.session_id), 0, -1)
+            pipe.get(tokens_key(self.session_id))
+            stages, tokens = pipe.execute()
+            return [json.loads(stage) for stage in stages], int(tokens or 0)
+        except redis.RedisError as e:
+            logging.warning(f"Failed to read progress for session {self.session_id}: {e}")
+            return [], self.tokens
+
+    def add_tokens(self, tokens):
+        self.tokens += tokens
+        try:
+            pipe = get_redis().pipeline()
+            pipe.incrby(tokens_key(self.session_id), tokens)
+            pipe.expire(tokens_key(self.session_id), STATUS_TTL)
+            pipe.execute()
+        except redis.RedisError as e:
+            logging.warning(f"Failed to record tokens for session {self.session_id}: {e}")
+
+    def eta_seconds(self, completed_stages):
+        if not self.typical_durations:
+            return None
+        now = time.time()
+        done = {s['stage'] for s in completed_stages}
+        remaining = 0.0
+        for step in self.planned_stages:
+            step_remaining = [
+                max(self.typical_durations.get(stage, 0.0) - (now - self.stage_started_at), 0.0)
+                if stage == self.stage else self.typical_durations.get(stage, 0.0)
+                for stage in (step if isinstance(step, tuple) else (step,)) if stage not in done
+            ]
+            remaining += max(step_remaining, default=0.0)
+        return round(remaining, 1)
+
+    def snapshot(self, state='PROGRESS'):
+        completed_stages, tokens = self._shared_state()
+        stages = _flatten(self.planned_stages)
+        return {
+            'session_id': self.session_id,
+            'state': state,
+            'stage': self.stage,
+            'stage_index': stages.index(self.stage) + 1 if self.stage in stages else None,
+            'stage_count': len(stages),
+            'stage_started_at': self.stage_started_at,
+            'queue': self.queue,
+            'enqueued_at': self.enqueued_at,
+            'started_at': self.started_at,
+            'queue_wait': round(self.started_at - self.enqueued_at, 3) if self.enqueued_at else None,
+            'tokens': tokens,
+            'eta_seconds': 0.0 if state == 'SUCCESS' else self.eta_seconds(completed_stages),
+            'sections_done': sum(1 for s in completed_stages if s['stage'].startswith('section:')),
+            'completed_stages': completed_stages,
+            'updated_at': time.time(),
+            **self.stage_data,
+        }
+
+    def _publish(self, event, state='PROGRESS', **data):
+        if self.finished and state == 'PROGRESS':
+            return
+        status = self.snapshot(state)
+        set_status(self.session_id, status)
+        if self.task is not None and state == 'PROGRESS':
+            try:
+                self.task.update_state(state='PROGRESS', meta=status)
+            except Exception as e:
+                logging.warning(f"Failed to update task state for session {self.session_id}: {e}")
+        publish_progress(
+            self.session_id, event, stage=self.stage, tokens=status['tokens'],
+            eta_seconds=status['eta_seconds'], sections_done=status['sections_done'], **data
+        )
+
+    def start_stage(self, stage, event=None, **data):
+        if self.stage is not None:
+            self.end_stage()
+        self.stage = stage
+        self.stage_started_at = time.time()
+        self.stage_memory = StageMemory()
+        self.stage_data = data
+        self.stage_flags = {}
+        self._publish(event or stage, **data)
+
+    def flag(self, name, value):
+        """Attach `value` to the current stage; it is kept in the stage's completed_stages entry."""
+        self.stage_flags[name] = value
+        self.stage_data[name] = value
+
+    def end_stage(self, event=None, **data):
+        if self.stage is None:
+            return
+        finished_at = time.time()
+        duration = finished_at - self.stage_started_at
+        completed = {
+            'stage': self.stage,
+            'started_at': self.stage_started_at,
+            'finished_at': finished_at,
+            'duration': round(duration, 3),
+            **self.stage_flags,
+        }
+        memory = self.stage_memory.finish()
+        if memory:
+            completed['memory'] = memory
+        completed = json.dumps(completed)
+        try:
+            pipe = get_redis().pipeline()
+            pipe.rpush(completed_stages_key(self.session_id), completed)
+            pipe.expire(completed_stages_key(self.session_id), STATUS_TTL)
+            pipe.execute()
+        except redis.RedisError as e:
+            logging.warning(f"Failed to record completed stage for session {self.session_id}: {e}")
+        record_stage_duration(self.stage, duration)
+        if self.stage.startswith('section:'):
+            observe('par_section_duration_seconds', duration, section=self.stage.split(':', 1)[1])
+        else:
+            observe('par_stage_duration_seconds', duration, stage=self.stage)
+        self.stage = None
+        self.stage_started_at = None
+        self.stage_memory = None
+        self.stage_data = {}
+        self.stage_flags = {}
+        if event:
+            self._publish(event, **data)
+
+    def complete(self, **data):
+        self.end_stage()
+        self._publish('complete', state='SUCCESS', **data)
+        observe('par_report_duration_seconds', time.time() - self.started_at)
+        inc('par_reports_total', status='success')
+        _local.tracker = None
+
+    def fail(self, message):
+        self.stage_data = {}
+        self._publish('error', state='FAILURE', message=message)
+        inc('par_reports_total', status='error')
+        _local.tracker = None
+
+    def detach(self):
+        """Stop attributing token usage in this thread to this report (end of a stage task)."""
+        self.end_stage()
+        if getattr(_local, 'tracker', None) is self:
+            _local.tracker = None
@@ -0,0 +1,21 @@
+import os
+import redis
+
+# redis_utils.py
+_redis_client = None
+_broker_client = None
+
+def get_redis():
+    global _redis_client
+    if _redis_client is None:
+        redis_url = os.getenv('REDIS_URL') or os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+        _redis_client = redis.Redis.from_url(redis_url, decode_responses=True)
+    return _redis_client
+
+def get_broker_redis():
+    # The broker may live on a different Redis than app state; used to inspect queue depth
+    global _broker_client
+    if _broker_client is None:
+        broker_url = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+        _broker_client = redis.Redis.from_url(broker_url, decode_responses=True)
+    return _broker_client
@@ -0,0 +1,43 @@
+import logging
+import redis
+from redis_utils import get_redis
+
+# report_cache.py
+# Caches report existence and presigned download URLs in Redis so the results
+# page does not need an S3 round trip on every hit.
+
+REPORT_EXISTS_TTL = 86400  # seconds
+PRESIGNED_URL_EXPIRY = 3600  # seconds the presigned URL stays valid
+PRESIGNED_URL_MARGIN = 300  # stop serving a cached URL this long before it expires
+
+def report_exists_key(s3_key):
+    return f"par:report_exists:{s3_key}"
+
+def report_url_key(s3_key):
+    return f"par:report_url:{s3_key}"
+
+def mark_report_exists(s3_key):
+    try:
+        get_redis().set(report_exists_key(s3_key), 1, ex=REPORT_EXISTS_TTL)
+    except redis.RedisError as e:
+        logging.warning(f"Failed to mark report {s3_key} as existing: {e}")
+
+def is_report_marked(s3_key):
+    try:
+        return bool(get_redis().exists(report_exists_key(s3_key)))
+    except redis.RedisError as e:
+        logging.warning(f"Failed to check report cache for {s3_key}: {e}")
+        return False
+
+def get_cached_report_url(s3_key):
+    try:
+        return get_redis().get(report_url_key(s3_key))
+    except redis.RedisError as e:
+        logging.warning(f"Failed to read cached URL for {s3_key}: {e}")
+        return None
+
+def cache_report_url(s3_key, url, expires_in=PRESIGNED_URL_EXPIRY):
+    try:
+        get_redis().set(report_url_key(s3_key), url, ex=max(expires_in - PRESIGNED_URL_MARGIN, 1))
+    except redis.RedisError as e:
+        logging.warning(f"Failed to cache URL for {s3_key}: {e}")
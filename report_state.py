@@ -0,0 +1,73 @@
+import logging
+import redis
+from redis_utils import get_redis
+
+# report_state.py
+# Intermediate results handed between the stage tasks of one report (see report_workflow):
+# extracted text per input file, generated markdown per section and, for the pipelined
+# workflow, the steps still waiting for their inputs. Kept in Redis rather than passed
+# through the broker, and expired once the report can no longer be in flight.
+
+REPORT_STATE_TTL = 6 * 3600  # seconds
+
+def texts_key(session_id):
+    return f"par:texts:{session_id}"
+
+def sections_key(session_id):
+    return f"par:sections:{session_id}"
+
+def gates_key(session_id):
+    return f"par:gates:{session_id}"
+
+def save_texts(session_id, all_texts):
+    pipe = get_redis().pipeline()
+    pipe.delete(texts_key(session_id))
+    if all_texts:
+        pipe.hset(texts_key(session_id), mapping=all_texts)
+    pipe.expire(texts_key(session_id), REPORT_STATE_TTL)
+    pipe.execute()
+
+def save_text(session_id, input_name, text):
+    pipe = get_redis().pipeline()
+    pipe.hset(texts_key(session_id), input_name, text)
+    pipe.expire(texts_key(session_id), REPORT_STATE_TTL)
+    pipe.execute()
+
+def load_texts(session_id):
+    return get_redis().hgetall(texts_key(session_id))
+
+def load_text_names(session_id):
+    return set(get_redis().hkeys(texts_key(session_id)))
+
+def save_section(session_id, section_name, content):
+    pipe = get_redis().pipeline()
+    pipe.hset(sections_key(session_id), section_name, content)
+    pipe.expire(sections_key(session_id), REPORT_STATE_TTL)
+    pipe.execute()
+
+def load_sections(session_id):
+    return get_redis().hgetall(sections_key(session_id))
+
+def load_section_names(session_id):
+    return set(get_redis().hkeys(sections_key(session_id)))
+
+def save_gates(session_id, gates):
+    """Store steps (name -> JSON) to be started once their inputs are ready."""
+    pipe = get_redis().pipeline()
+    pipe.delete(gates_key(session_id))
+    pipe.hset(gates_key(session_id), mapping=gates)
+    pipe.expire(gates_key(session_id), REPORT_STATE_TTL)
+    pipe.execute()
+
+def load_gates(session_id):
+    return get_redis().hgetall(gates_key(session_id))
+
+def claim_gate(session_id, name):
+    """True for exactly one caller: whoever removes the gate starts its step."""
+    return get_redis().hdel(gates_key(session_id), name) == 1
+
+def clear_report_state(session_id):
+    try:
+        get_redis().delete(texts_key(session_id), sections_key(session_id), gates_key(session_id))
+    except redis.RedisError as e:
+        logging.warning(f"Failed to clear intermediate state for session {session_id}: {e}")
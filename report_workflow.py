@@ -0,0 +1,169 @@
+# report_workflow.py
+# The report pipeline as a Celery canvas:
+#
+#   extract_report_inputs                      (CPU queue: S3 download + PyPDF2)
+#   -> group(independent sections)             (LLM queue, in parallel)
+#   -> collect_sections                        (barrier)
+#   -> group(dependent sections)               (LLM queue, in parallel; need the first six)
+#   -> render_and_upload_report                (CPU queue: ReportLab + S3 upload)
+#
+# The pipelined variant (build_pipelined_workflow) starts work while files are still being
+# uploaded: every file gets its own extract_input_file task as soon as it is in S3, and the
+# rest of the report is split into gates, steps that start once their inputs are ready:
+#
+#   early       Transcript + intake form extracted   -> group(EARLY_SECTIONS)
+#   late        every input extracted                -> group(other independent sections)
+#   dependent   every independent section generated  -> group(dependent sections) -> render
+#
+# The web process builds the gates' signatures up front and stores them in Redis; the task
+# that completes a gate's last input claims it and starts it (fire_ready_gates).
+#
+# Signatures are built by task name so the web process can enqueue the workflow without
+# importing the report generator. Intermediate results are kept in Redis (report_state).
+import json
+import logging
+import uuid
+from report_state import save_gates, load_gates, claim_gate, load_text_names, load_section_names
+
+# Files a clinician uploads for one report; missing ones are replaced by blank PDFs
+INPUT_FILES = (
+    'Transcript.pdf', 'IntakeForm_Results.pdf', 'CATQ_Results.pdf',
+    'GAD_Results.pdf', 'GARS_Results.pdf', 'KBIT_Results.pdf',
+    'RAADSR_Results.pdf', 'SRS2_Results.pdf', 'Vineland_Results.pdf',
+)
+
+# LLM calls that make up a full report, in generation order
+SECTION_NAMES = [
+    'sections_1_3', 'section_4', 'section_5', 'sections_6_7', 'section_8',
+    'sections_9_11', 'sections_12_14', 'section_15', 'section_16',
+]
+# Sections whose prompts only need the extracted input texts
+INDEPENDENT_SECTIONS = SECTION_NAMES[:6]
+# Sections whose prompts also need the text of the independent sections
+DEPENDENT_SECTIONS = SECTION_NAMES[6:]
+# Independent sections that only need the transcript and the intake form
+EARLY_SECTIONS = ['sections_1_3', 'section_4', 'sections_6_7']
+EARLY_INPUTS = ['Transcript', 'IntakeForm_Results']
+
+# Stage plan of the canvas; tuples are stages that run in parallel (see ReportProgress)
+WORKFLOW_STAGES = (
+    ['download', 'extract']
+    + [tuple(f'section:{name}' for name in INDEPENDENT_SECTIONS)]
+    + [tuple(f'section:{name}' for name in DEPENDENT_SECTIONS)]
+    + ['render', 'upload']
+)
+
+
+def input_name(filename):
+    """Key of a file's extracted text, e.g. 'Transcript' for Transcript.pdf."""
+    return filename.split('/')[-1].split('.')[0]
+
+
+PIPELINED_STAGES = (
+    [tuple(f'extract:{input_name(filename)}' for filename in INPUT_FILES)]
+    + WORKFLOW_STAGES[2:]
+)
+
+# Stage plan per workflow, so every task of a report reports against the same plan
+STAGE_PLANS = {'canvas': WORKFLOW_STAGES, 'pipelined': PIPELINED_STAGES}
+
+EXTRACT_TASK = 'adult_report_generator.extract_report_inputs'
+EXTRACT_FILE_TASK = 'adult_report_generator.extract_input_file'
+SECTION_TASK = 'adult_report_generator.generate_section_task'
+COLLECT_TASK = 'adult_report_generator.collect_sections'
+RENDER_TASK = 'adult_report_generator.render_and_upload_report'
+FAILED_TASK = 'adult_report_generator.report_failed'
+
+
+def cpu_queue_for(queue):
+    """CPU-bound stages of a report go to a sibling queue consumed by a prefork pool."""
+    return f"{queue}.cpu"
+
+
+def slow_queue_for(queue):
+    """Extraction of long or image-only files (see pdf_preflight) goes to its own queue."""
+    return f"{queue}.slow"
+
+
+def build_report_workflow(celery, queue, session_id, s3_paths, aws_access_key_id, aws_secret_access_key, aws_default_region, s3_bucket):
+    from celery import chain, group
+
+    aws_args = (aws_access_key_id, aws_secret_access_key, aws_default_region, s3_bucket)
+    cpu_queue = cpu_queue_for(queue)
+
+    def section(name):
+        return celery.signature(SECTION_TASK, args=(session_id, name), queue=queue, immutable=True)
+
+    workflow = chain(
+        celery.signature(EXTRACT_TASK, args=(session_id, s3_paths) + aws_args, queue=cpu_queue, immutable=True),
+        group(section(name) for name in INDEPENDENT_SECTIONS),
+        celery.signature(COLLECT_TASK, args=(session_id,), queue=queue),
+        group(section(name) for name in DEPENDENT_SECTIONS),
+        celery.signature(RENDER_TASK, args=(session_id,) + aws_args, queue=cpu_queue),
+    )
+    workflow.on_error(celery.signature(FAILED_TASK, args=(session_id,), queue=cpu_queue))
+    return workflow
+
+
+def build_pipelined_workflow(celery, queue, session_id, aws_access_key_id, aws_secret_access_key, aws_default_region, s3_bucket):
+    """Store the gates of a pipelined report and return the id its render task will have.
+
+    Call before the first file is uploaded, then send extract_file_signature for each file.
+    """
+    from celery import chain, group
+
+    aws_args = (aws_access_key_id, aws_secret_access_key, aws_default_region, s3_bucket)
+    cpu_queue = cpu_queue_for(queue)
+    failed = celery.signature(FAILED_TASK, args=(session_id,), queue=cpu_queue)
+    render_task_id = str(uuid.uuid4())
+
+    def sections(names):
+        return group(
+            celery.signature(SECTION_TASK, args=(session_id, name), kwargs={'workflow': 'pipelined'}, queue=queue, immutable=True)
+            for name in names
+        )
+
+    late_sections = [name for name in INDEPENDENT_SECTIONS if name not in EARLY_SECTIONS]
+    steps = {
+        'early': ({'inputs': EARLY_INPUTS}, sections(EARLY_SECTIONS)),
+        'late': ({'inputs': [input_name(filename) for filename in INPUT_FILES]}, sections(late_sections)),
+        'dependent': ({'sections': INDEPENDENT_SECTIONS}, chain(
+            sections(DEPENDENT_SECTIONS),
+            celery.signature(RENDER_TASK, args=(session_id,) + aws_args, kwargs={'workflow': 'pipelined'},
+                             queue=cpu_queue, task_id=render_task_id),
+        )),
+    }
+    gates = {}
+    for name, (requires, step) in steps.items():
+        step.on_error(failed)
+        gates[name] = json.dumps({**requires, 'signature': step})
+    save_gates(session_id, gates)
+    return render_task_id
+
+
+def extract_file_signature(celery, queue, session_id, filename, s3_key, aws_access_key_id, aws_secret_access_key, aws_default_region, s3_bucket, slow=False):
+    signature = celery.signature(
+        EXTRACT_FILE_TASK,
+        args=(session_id, filename, s3_key, aws_access_key_id, aws_secret_access_key, aws_default_region, s3_bucket),
+        queue=slow_queue_for(queue) if slow else cpu_queue_for(queue),
+    )
+    signature.on_error(celery.signature(FAILED_TASK, args=(session_id,), queue=cpu_queue_for(queue)))
+    return signature
+
+
+def fire_ready_gates(celery, session_id):
+    """Start every stored step of a pipelined report whose inputs are now all available."""
+    gates = load_gates(session_id)
+    if not gates:
+        return []
+    texts, sections = load_text_names(session_id), load_section_names(session_id)
+    fired = []
+    for name, gate in gates.items():
+        gate = json.loads(gate)
+        if not set(gate.get('inputs', [])) <= texts or not set(gate.get('sections', [])) <= sections:
+            continue
+        if claim_gate(session_id, name):
+            logging.info(f"Starting {name} step of report {session_id}")
+            celery.signature(gate['signature']).apply_async()
+            fired.append(name)
+    return fired
@@ -0,0 +1,242 @@
+import os
+import sys
+import time
+import shutil
+import logging
+import argparse
+from datetime import datetime, timezone
+import redis
+from config import config
+from redis_utils import get_redis
+from s3_utils import get_s3_client
+from metrics import inc, set_gauge
+from report_cache import report_exists_key, report_url_key
+from blob_store import BLOB_PREFIX
+from text_sidecar import source_key
+from tracing import TRACE_FILE
+from process_files import process_files
+
+# retention.py
+# Lifecycle of the artifacts a report leaves behind, and the job that enforces it.
+#
+#   uploads/{session_id}/*.pdf        uploaded assessment PDFs        RETENTION_UPLOADS_DAYS
+#   blobs/{sha256}.pdf                uploads stored by content hash  RETENTION_UPLOADS_DAYS
+#                                     (since last use, see blob_store)
+#   {session_id}/generated_par.pdf    the generated report            RETENTION_REPORTS_DAYS
+#   {session_id}/*.pdf                blank placeholders for missing  RETENTION_PLACEHOLDERS_DAYS
+#                                     uploads
+#   {pdf key}.text.json.gz            extracted text (text_sidecar)   same as the PDF
+#   UPLOAD_FOLDER, OUTPUT_FOLDER      local working directories       RETENTION_LOCAL_HOURS
+#   app.{pid}.log[.N],                log and trace files of exited   RETENTION_LOCAL_HOURS
+#   report_generator.{pid}.log[.N],   processes, rotated backups
+#   traces.{pid}.jsonl[.N]            (see process_files)
+#   Redis keys without a TTL          Celery results                  see REDIS_KEY_TTLS
+#
+# Run it on a schedule (e.g. daily from a scheduler dyno or cron):
+#
+#   python retention.py [--dry-run]
+#
+# It also records storage gauges (objects and bytes per artifact kind, local disk, Redis
+# memory) so growth shows up on /metrics.
+
+DAY = 86400
+RETENTION_DAYS = {
+    'upload': float(os.getenv('RETENTION_UPLOADS_DAYS', 30)),
+    'blob': float(os.getenv('RETENTION_UPLOADS_DAYS', 30)),
+    'report': float(os.getenv('RETENTION_REPORTS_DAYS', 90)),
+    'placeholder': float(os.getenv('RETENTION_PLACEHOLDERS_DAYS', 30)),
+}
+RETENTION_LOCAL_HOURS = float(os.getenv('RETENTION_LOCAL_HOURS', 24))
+
+# The log files passed to configure_logging by the web app and the workers
+LOG_FILES = (os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.log'), 'report_generator.log')
+
+# Key pattern -> TTL (seconds) given to matching keys that were written without one
+REDIS_KEY_TTLS = {
+    'celery-task-meta-*': int(os.getenv('CELERY_RESULT_EXPIRES', DAY)),
+}
+
+DELETE_BATCH_SIZE = 1000  # the most delete_objects accepts per request
+REPORT_FILENAME = 'generated_par.pdf'
+
+
+def artifact_kind(key):
+    """Which retention class an S3 key belongs to, or None for keys this app did not write."""
+    # Text sidecars expire with the PDF they were extracted from
+    key = source_key(key) or key
+    parts = key.split('/')
+    if parts[0] == 'uploads' and len(parts) == 3:
+        return 'upload'
+    if key.startswith(BLOB_PREFIX):
+        return 'blob' if len(parts) == 2 else None
+    if len(parts) == 2 and parts[1] == REPORT_FILENAME:
+        return 'report'
+    if len(parts) == 2 and parts[1].endswith('.pdf'):
+        return 'placeholder'
+    return None
+
+def delete_keys(s3, bucket, keys):
+    """Delete keys with batched delete_objects calls; returns the keys that failed."""
+    failed = []
+    for start in range(0, len(keys), DELETE_BATCH_SIZE):
+        batch = keys[start:start + DELETE_BATCH_SIZE]
+        response = s3.delete_objects(Bucket=bucket, Delete={'Objects': [{'Key': key} for key in batch], 'Quiet': True})
+        for error in response.get('Errors', []):
+            logging.error(f"Failed to delete {error['Key']}: {error.get('Code')} {error.get('Message')}")
+            failed.append(error['Key'])
+    return failed
+
+def cleanup_s3(s3, bucket, now=None, dry_run=False):
+    """Delete expired artifacts in `bucket`; returns per-kind totals of stored and deleted objects."""
+    now = now or datetime.now(timezone.utc)
+    stats = {kind: {'objects': 0, 'bytes': 0, 'deleted_objects': 0, 'deleted_bytes': 0} for kind in RETENTION_DAYS}
+    expired, sizes = [], {}
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket):
+        for obj in page.get('Contents', []):
+            kind = artifact_kind(obj['Key'])
+            if kind is None:
+                continue
+            stats[kind]['objects'] += 1
+            stats[kind]['bytes'] += obj['Size']
+            if (now - obj['LastModified']).total_seconds() > RETENTION_DAYS[kind] * DAY:
+                expired.append(obj['Key'])
+                sizes[obj['Key']] = (kind, obj['Size'])
+
+    if expired and not dry_run:
+        failed = set(delete_keys(s3, bucket, expired))
+        expired = [key for key in expired if key not in failed]
+        forget_reports([key for key in expired if sizes[key][0] == 'report'])
+    for key in expired:
+        kind, size = sizes[key]
+        stats[kind]['deleted_objects'] += 1
+        stats[kind]['deleted_bytes'] += size
+    return stats
+
+def forget_reports(report_keys):
+    # The results page trusts these caches; drop them so deleted reports are not linked to
+    if not report_keys:
+        return
+    try:
+        get_redis().delete(*[report_exists_key(key) for key in report_keys], *[report_url_key(key) for key in report_keys])
+    except redis.RedisError as e:
+        logging.warning(f"Failed to clear report caches: {e}")
+
+def folder_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def prune_local_folder(folder, max_age_seconds, now=None, dry_run=False):
+    """Remove entries of `folder` not modified for `max_age_seconds`; returns how many."""
+    now = now or time.time()
+    removed = 0
+    if not os.path.isdir(folder):
+        return removed
+    for entry in os.scandir(folder):
+        if entry.name.startswith('.'):
+            continue
+        try:
+            if now - entry.stat(follow_symlinks=False).st_mtime <= max_age_seconds:
+                continue
+            if not dry_run:
+                if entry.is_dir(follow_symlinks=False):
+                    shutil.rmtree(entry.path)
+                else:
+                    os.remove(entry.path)
+            removed += 1
+        except OSError as e:
+            logging.warning(f"Failed to remove {entry.path}: {e}")
+    return removed
+
+def process_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def prune_process_files(path, max_age_seconds, now=None, dry_run=False):
+    """Remove per-process files of `path` not written to for `max_age_seconds`; returns how many.
+
+    The current file of a process still running here is left alone: its handler keeps it open.
+    """
+    now = now or time.time()
+    removed = 0
+    for file, pid, is_backup in process_files(path):
+        if not is_backup and process_running(pid):
+            continue
+        try:
+            if now - os.path.getmtime(file) <= max_age_seconds:
+                continue
+            if not dry_run:
+                os.remove(file)
+            removed += 1
+        except OSError as e:
+            logging.warning(f"Failed to remove {file}: {e}")
+    return removed
+
+def expire_orphaned_keys(redis_client, dry_run=False):
+    """Give keys matching REDIS_KEY_TTLS a TTL if they have none; returns how many per pattern."""
+    fixed = {}
+    for pattern, ttl in REDIS_KEY_TTLS.items():
+        fixed[pattern] = 0
+        for key in redis_client.scan_iter(match=pattern, count=1000):
+            if redis_client.ttl(key) == -1:
+                if not dry_run:
+                    redis_client.expire(key, ttl)
+                fixed[pattern] += 1
+    return fixed
+
+def run(dry_run=False):
+    bucket = config.S3_BUCKET
+    s3 = get_s3_client(config.AWS_ACCESS_KEY_ID, config.AWS_SECRET_ACCESS_KEY, config.AWS_REGION)
+    prefix = 'Would delete' if dry_run else 'Deleted'
+
+    stats = cleanup_s3(s3, bucket, dry_run=dry_run)
+    for kind, kind_stats in stats.items():
+        logging.info(f"{kind}: {kind_stats['objects']} objects ({kind_stats['bytes']} bytes), "
+                     f"{prefix.lower()} {kind_stats['deleted_objects']} ({kind_stats['deleted_bytes']} bytes)")
+        if not dry_run:
+            set_gauge('par_storage_objects', kind_stats['objects'] - kind_stats['deleted_objects'], kind=kind)
+            set_gauge('par_storage_bytes', kind_stats['bytes'] - kind_stats['deleted_bytes'], kind=kind)
+            inc('par_retention_deleted_objects_total', kind_stats['deleted_objects'], kind=kind)
+            inc('par_retention_deleted_bytes_total', kind_stats['deleted_bytes'], kind=kind)
+
+    for folder in (config.UPLOAD_FOLDER, config.OUTPUT_FOLDER):
+        removed = prune_local_folder(folder, RETENTION_LOCAL_HOURS * 3600, dry_run=dry_run)
+        logging.info(f"{prefix} {removed} entries from {folder}")
+        if not dry_run:
+            set_gauge('par_local_storage_bytes', folder_size(folder), folder=os.path.basename(os.path.normpath(folder)))
+
+    for folder, paths in (('logs', LOG_FILES), ('traces', (TRACE_FILE,))):
+        for path in paths:
+            removed = prune_process_files(path, RETENTION_LOCAL_HOURS * 3600, dry_run=dry_run)
+            logging.info(f"{prefix} {removed} per-process files of {path}")
+        if not dry_run:
+            set_gauge('par_local_storage_bytes', sum(os.path.getsize(file) for path in paths
+                                                     for file, _, _ in process_files(path)), folder=folder)
+
+    try:
+        redis_client = get_redis()
+        for pattern, count in expire_orphaned_keys(redis_client, dry_run=dry_run).items():
+            logging.info(f"{'Would set' if dry_run else 'Set'} a TTL on {count} Redis keys matching {pattern}")
+        if not dry_run:
+            set_gauge('par_redis_used_memory_bytes', redis_client.info('memory')['used_memory'])
+    except redis.RedisError as e:
+        logging.warning(f"Redis cleanup failed: {e}")
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Delete expired report artifacts and record storage metrics.')
+    parser.add_argument('--dry-run', action='store_true', help='only report what would be deleted')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s', stream=sys.stdout)
+    run(dry_run=args.dry_run)
@@ -1,14 +1,37 @@
+import os
 import boto3
 import logging
+import threading
+from botocore.config import Config as BotoConfig
 from botocore.exceptions import ClientError
+from config import config
 
 # s3_utils.py
+_s3_clients = {}
+_s3_clients_lock = threading.Lock()
+
 def get_s3_client(aws_access_key_id, aws_secret_access_key, aws_region):
-    return boto3.client('s3',
-        aws_access_key_id=aws_access_key_id,
-        aws_secret_access_key=aws_secret_access_key,
-        region_name=aws_region
-    )
+    # Building a client costs tens of milliseconds; create one per process and credentials
+    # on first use. Keyed by pid because clients must not be shared across a fork.
+    key = (os.getpid(), aws_access_key_id, aws_secret_access_key, aws_region)
+    s3_client = _s3_clients.get(key)
+    if s3_client is None:
+        with _s3_clients_lock:
+            s3_client = _s3_clients.get(key)
+            if s3_client is None:
+                s3_client = boto3.client('s3',
+                    aws_access_key_id=aws_access_key_id,
+                    aws_secret_access_key=aws_secret_access_key,
+                    region_name=aws_region,
+                    endpoint_url=config.S3_ENDPOINT_URL,
+                    config=BotoConfig(
+                        connect_timeout=config.S3_CONNECT_TIMEOUT,
+                        read_timeout=config.S3_READ_TIMEOUT,
+                        retries={'max_attempts': 3, 'mode': 'standard'}
+                    )
+                )
+                _s3_clients[key] = s3_client
+    return s3_client
 
 # Function to upload a file to S3
 def upload_file_to_s3(file_obj, filename, session_id, aws_access_key_id, aws_secret_access_key, aws_region, s3_bucket):
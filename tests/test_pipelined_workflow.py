@@ -0,0 +1,61 @@
+"""The pipelined workflow run eagerly against the benchmark stand-ins (moto, fakeredis and
+the fake OpenAI server), so it needs benchmarks/requirements.txt but no credentials:
+
+    python -m pytest tests
+"""
+import uuid
+
+import pytest
+
+from benchmarks.bench_pipeline import BUCKET, CREDENTIALS, configure_environment, upload_inputs
+from benchmarks.fakes import FakeOpenAIServer, make_assessment_set, start_local_s3, use_fake_redis
+
+
+@pytest.fixture(scope='module')
+def celery():
+    fake_openai = FakeOpenAIServer(ttft=0, tokens_per_second=10000, completion_tokens=50).start()
+    configure_environment(fake_openai)
+    s3_mock = start_local_s3(BUCKET)
+    use_fake_redis()
+
+    from celery_config import get_celery
+    import adult_report_generator  # noqa: F401 (registers the tasks)
+    get_celery().conf.update(task_always_eager=True, task_store_eager_result=True)
+    yield get_celery()
+    s3_mock.stop()
+    fake_openai.stop()
+
+
+def run_pipelined(celery, files):
+    """Extract every file in upload order; returns (session id, task result per filename)."""
+    from celery_config import INTERACTIVE_QUEUE
+    from progress import mark_queued
+    from report_workflow import build_pipelined_workflow, extract_file_signature
+
+    session_id = str(uuid.uuid4())
+    mark_queued(session_id, INTERACTIVE_QUEUE)
+    build_pipelined_workflow(celery, INTERACTIVE_QUEUE, session_id, *CREDENTIALS, BUCKET)
+    results = {}
+    for filename, s3_key in upload_inputs(session_id, files).items():
+        signature = extract_file_signature(celery, INTERACTIVE_QUEUE, session_id, filename, s3_key, *CREDENTIALS, BUCKET)
+        results[filename] = signature.apply()
+    return session_id, results
+
+
+def test_failed_file_fails_the_report(celery):
+    from progress import get_status, get_progress_events
+
+    files = make_assessment_set(transcript_pages=2)
+    # Files before it are extracted (and may start sections), files after it arrive late
+    broken = list(files)[len(files) // 2]
+    files[broken] = b'not a pdf'
+
+    session_id, results = run_pipelined(celery, files)
+
+    assert results[broken].failed()
+    status = get_status(session_id)
+    assert status['state'] == 'FAILURE'
+    assert status['failed_task'] == 'adult_report_generator.extract_input_file'
+    events = [event['event'] for event in get_progress_events(session_id)]
+    assert events.count('error') == 1
+    assert events[-1] == 'error'
@@ -0,0 +1,69 @@
+import gzip
+import json
+import time
+import logging
+from botocore.exceptions import ClientError
+from metrics import inc
+
+# text_sidecar.py
+# The text extracted from an input PDF, stored next to it in S3 as {key}.text.json.gz:
+#
+#   {"version": 1, "source": key, "extracted_at": ..., "preflight": {...}, "pages": [...]}
+#
+# `pages` holds the text of each page, or null for pages without a text layer and pages
+# past PDF_MAX_PAGES (see pdf_preflight). The first task that parses a PDF writes its
+# sidecar; retries, regenerations, section reruns and batch jobs then read a few kilobytes
+# of gzipped JSON instead of downloading and parsing the PDF. For blobs, the Redis text
+# cache (blob_store) is consulted first.
+#
+# Sidecars expire with the PDF they belong to (see retention). A missing or unreadable
+# sidecar only means the PDF is parsed again.
+
+SIDECAR_SUFFIX = '.text.json.gz'
+SIDECAR_VERSION = 1
+
+
+def sidecar_key(s3_key):
+    return f"{s3_key}{SIDECAR_SUFFIX}"
+
+def source_key(key):
+    """The key of the PDF a sidecar belongs to, or None if `key` is not a sidecar."""
+    return key[:-len(SIDECAR_SUFFIX)] if key.endswith(SIDECAR_SUFFIX) else None
+
+
+def write_sidecar(s3, bucket, s3_key, pages, preflight):
+    body = gzip.compress(json.dumps({
+        'version': SIDECAR_VERSION,
+        'source': s3_key,
+        'extracted_at': time.time(),
+        'preflight': preflight,
+        'pages': pages,
+    }).encode())
+    try:
+        s3.put_object(Bucket=bucket, Key=sidecar_key(s3_key), Body=body, ContentType='application/gzip')
+    except ClientError as e:
+        logging.warning(f"Failed to write text sidecar of {s3_key}: {e}")
+        return False
+    inc('par_text_sidecar_total', result='written')
+    return True
+
+def read_sidecar(s3, bucket, s3_key):
+    """The sidecar document of `s3_key`, or None if there is no usable one."""
+    try:
+        body = s3.get_object(Bucket=bucket, Key=sidecar_key(s3_key))['Body'].read()
+    except ClientError as e:
+        if e.response['Error']['Code'] not in ('404', 'NoSuchKey', 'NotFound'):
+            logging.warning(f"Failed to read text sidecar of {s3_key}: {e}")
+        inc('par_text_sidecar_total', result='miss')
+        return None
+    try:
+        document = json.loads(gzip.decompress(body))
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable text sidecar of {s3_key}: {e}")
+        document = None
+    if not document or document.get('version') != SIDECAR_VERSION:
+        inc('par_text_sidecar_total', result='miss')
+        return None
+    inc('par_text_sidecar_total', result='hit')
+    inc('par_input_read_bytes_total', len(body), source='sidecar')
+    return document
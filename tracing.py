@@ -0,0 +1,263 @@
+import os
+import sys
+import json
+import time
+import queue
+import logging
+import secrets
+import threading
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import RotatingFileHandler
+from urllib import request as urllib_request
+from process_files import process_file, process_files
+
+# tracing.py
+# Minimal OpenTelemetry-style tracing: W3C `traceparent` propagation from the web
+# request into Celery task headers, and spans exported as JSON lines to a local file
+# or as OTLP/HTTP JSON to a collector. Run `python tracing.py <session_id|trace_id>`
+# to print a waterfall of one report.
+#
+# Export is off unless TRACE_EXPORT is set. Like the logs, each process writes its own
+# trace file, traces.{pid}.jsonl (see process_files): at TRACE_MAX_BYTES it moves to
+# traces.{pid}.jsonl.1 and at most TRACE_BACKUP_COUNT old files are kept. Files of exited
+# processes are removed by retention; the waterfall reads all of them.
+
+TRACE_EXPORT = os.getenv('TRACE_EXPORT', 'none')  # 'file', 'otlp' or 'none'
+TRACE_FILE = os.getenv('TRACE_FILE', 'traces.jsonl')
+TRACE_MAX_BYTES = int(os.getenv('TRACE_MAX_BYTES', 10 * 1024 * 1024))
+TRACE_BACKUP_COUNT = int(os.getenv('TRACE_BACKUP_COUNT', 3))
+OTLP_ENDPOINT = os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT', 'http://localhost:4318')
+SERVICE_NAME = os.getenv('OTEL_SERVICE_NAME', 'par')
+
+_current_span = contextvars.ContextVar('current_span', default=None)
+_export_queue = queue.Queue(maxsize=10000)
+_exporter_thread = None
+_exporter_lock = threading.Lock()
+_trace_handler = None
+_trace_handler_pid = None
+
+
+class Span:
+    def __init__(self, name, trace_id, parent_id=None, attributes=None):
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self.end_time = None
+        self.status = 'OK'
+
+    def set_attribute(self, key, value):
+        self.attributes[key] = value
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'service': SERVICE_NAME,
+            'start_time': self.start_time,
+            'end_time': self.end_time,
+            'duration': round(self.end_time - self.start_time, 6) if self.end_time else None,
+            'status': self.status,
+            'attributes': self.attributes,
+        }
+
+
+def current_span():
+    return _current_span.get()
+
+def parse_traceparent(traceparent):
+    """Return (trace_id, parent_span_id) from a W3C traceparent header, or None."""
+    try:
+        version, trace_id, span_id, flags = traceparent.split('-')
+        if len(trace_id) == 32 and len(span_id) == 16:
+            return trace_id, span_id
+    except (AttributeError, ValueError):
+        pass
+    return None
+
+def inject_headers(headers=None):
+    headers = {} if headers is None else headers
+    span = current_span()
+    if span is not None:
+        headers['traceparent'] = f"00-{span.trace_id}-{span.span_id}-01"
+    return headers
+
+def begin_span(name, traceparent=None, **attributes):
+    """Start a span and make it current. Pair with end_span(span, token)."""
+    parent = current_span()
+    remote = parse_traceparent(traceparent) if traceparent else None
+    if remote:
+        trace_id, parent_id = remote
+    elif parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+    else:
+        trace_id, parent_id = secrets.token_hex(16), None
+    span = Span(name, trace_id, parent_id, attributes)
+    return span, _current_span.set(span)
+
+def end_span(span, token, error=None):
+    span.end_time = time.time()
+    if error is not None:
+        span.status = 'ERROR'
+        span.set_attribute('error.type', type(error).__name__)
+    _current_span.reset(token)
+    _export(span)
+
+@contextmanager
+def start_span(name, traceparent=None, **attributes):
+    span, token = begin_span(name, traceparent, **attributes)
+    try:
+        yield span
+    except BaseException as e:
+        end_span(span, token, error=e)
+        raise
+    else:
+        end_span(span, token)
+
+
+def _inject_task_headers(headers=None, **kwargs):
+    # Propagate the current trace into every task sent from inside a span
+    if headers is not None and 'traceparent' not in headers:
+        inject_headers(headers)
+
+def install_celery_propagation():
+    """Connect the publish hook; called when the Celery app is built so importing this module stays cheap."""
+    from celery.signals import before_task_publish
+    before_task_publish.connect(_inject_task_headers, weak=False)
+
+def task_traceparent(task_request):
+    """Read the propagated traceparent from a Celery task request."""
+    return getattr(task_request, 'traceparent', None) or (getattr(task_request, 'headers', None) or {}).get('traceparent')
+
+
+# Export
+
+def _export(span):
+    if TRACE_EXPORT == 'none':
+        return
+    _ensure_exporter()
+    try:
+        _export_queue.put_nowait(span.to_dict())
+    except queue.Full:
+        logging.warning("Trace export queue full, dropping span")
+
+def _ensure_exporter():
+    global _exporter_thread
+    # Checked per process so a forked worker starts its own exporter thread
+    if _exporter_thread is not None and _exporter_thread.is_alive():
+        return
+    with _exporter_lock:
+        if _exporter_thread is None or not _exporter_thread.is_alive():
+            _exporter_thread = threading.Thread(target=_export_loop, name='trace-exporter', daemon=True)
+            _exporter_thread.start()
+
+def _export_loop():
+    while True:
+        batch = [_export_queue.get()]
+        while len(batch) < 512:
+            try:
+                batch.append(_export_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            if TRACE_EXPORT == 'otlp':
+                _export_otlp(batch)
+            else:
+                _export_file(batch)
+        except Exception as e:
+            logging.warning(f"Failed to export {len(batch)} spans: {e}")
+
+def _export_file(batch):
+    global _trace_handler, _trace_handler_pid
+    # Only the exporter thread writes; opened per process so forked workers get their own file
+    if _trace_handler is None or _trace_handler_pid != os.getpid():
+        _trace_handler = RotatingFileHandler(process_file(TRACE_FILE), maxBytes=TRACE_MAX_BYTES, backupCount=TRACE_BACKUP_COUNT)
+        _trace_handler.setFormatter(logging.Formatter('%(message)s'))
+        _trace_handler_pid = os.getpid()
+    for span in batch:
+        _trace_handler.emit(logging.makeLogRecord({'msg': json.dumps(span)}))
+
+def trace_files(trace_file=TRACE_FILE):
+    """The trace files of every process and their rotated backups."""
+    return [path for path, _, _ in process_files(trace_file)]
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+def _export_otlp(batch):
+    spans = [{
+        'traceId': span['trace_id'],
+        'spanId': span['span_id'],
+        'parentSpanId': span['parent_id'] or '',
+        'name': span['name'],
+        'kind': 1,
+        'startTimeUnixNano': str(int(span['start_time'] * 1e9)),
+        'endTimeUnixNano': str(int(span['end_time'] * 1e9)),
+        'status': {'code': 2 if span['status'] == 'ERROR' else 1},
+        'attributes': [{'key': k, 'value': _otlp_value(v)} for k, v in span['attributes'].items()],
+    } for span in batch]
+    body = {'resourceSpans': [{
+        'resource': {'attributes': [{'key': 'service.name', 'value': {'stringValue': SERVICE_NAME}}]},
+        'scopeSpans': [{'scope': {'name': 'par.tracing'}, 'spans': spans}],
+    }]}
+    req = urllib_request.Request(
+        f"{OTLP_ENDPOINT.rstrip('/')}/v1/traces",
+        data=json.dumps(body).encode(),
+        headers={'Content-Type': 'application/json'},
+    )
+    urllib_request.urlopen(req, timeout=5).close()
+
+
+# Waterfall view
+
+def print_waterfall(key, trace_file=TRACE_FILE, width=60):
+    spans = []
+    # A report's spans are spread over the web and worker processes and may straddle a rotation
+    for path in trace_files(trace_file):
+        with open(path) as f:
+            spans.extend(json.loads(line) for line in f if line.strip())
+    trace_ids = {s['trace_id'] for s in spans if key in (s['trace_id'], s['attributes'].get('session_id'))}
+    spans = sorted((s for s in spans if s['trace_id'] in trace_ids), key=lambda s: s['start_time'])
+    if not spans:
+        print(f"No spans found for {key}")
+        return
+
+    children = {}
+    for span in spans:
+        children.setdefault(span['parent_id'], []).append(span)
+    known = {s['span_id'] for s in spans}
+    roots = [s for s in spans if s['parent_id'] not in known]
+
+    start = spans[0]['start_time']
+    total = max(s['end_time'] for s in spans) - start or 1
+    print(f"trace {', '.join(sorted(trace_ids))}  total {total:.2f}s")
+
+    def walk(span, depth):
+        offset = int((span['start_time'] - start) / total * width)
+        length = max(int(span['duration'] / total * width), 1)
+        bar = ' ' * offset + '#' * length
+        label = f"{'  ' * depth}{span['name']}"
+        print(f"{label[:40]:<40} {bar:<{width}} {span['duration']:8.3f}s {span['status']}")
+        for child in children.get(span['span_id'], []):
+            walk(child, depth + 1)
+
+    for root in roots:
+        walk(root, 0)
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        print("Usage: python tracing.py <session_id|trace_id>")
+        sys.exit(1)
+    print_waterfall(sys.argv[1])
@@ -1,29 +1,22 @@
 # utils.py
 
 import logging
-import PyPDF2
-from reportlab.pdfgen import canvas
 import os
-import markdown2
-from io import BytesIO
-from PyPDF2 import PdfReader
 import sys
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib.units import inch
-import re
-from html import escape
-from xml.etree.ElementTree import fromstring, ParseError
-from reportlab.lib.enums import TA_JUSTIFY, TA_LEFT, TA_CENTER
+from io import BytesIO
 
-sys.setrecursionlimit(5000)  # Increase as needed, but be cautious
+# PyPDF2 and ReportLab are imported inside the functions that use them so that the
+# web process, which only needs allowed_file (and PyPDF2 once a file is uploaded, see
+# pdf_preflight), does not pay for them at startup.
+
+RENDER_RECURSION_LIMIT = 5000  # ReportLab recurses deeply on long paragraphs
 
 def allowed_file(filename):
     return '.' in filename and \
            filename.rsplit('.', 1)[1].lower() in {'pdf'}
 
 def extract_text_with_pypdf2(pdf_path):
+    import PyPDF2
     logging.info(f"Extracting text from {pdf_path} using PyPDF2")
     try:
         with open(pdf_path, 'rb') as file:
@@ -38,6 +31,7 @@ def extract_text_with_pypdf2(pdf_path):
 
 def create_blank_pdf(filename, output_folder):
     """Create a blank PDF file with the given filename in the output folder."""
+    from reportlab.pdfgen import canvas
     filepath = os.path.join(output_folder, filename)
     c = canvas.Canvas(filepath)
     c.setFont("Helvetica", 12)
@@ -46,14 +40,36 @@ def create_blank_pdf(filename, output_folder):
     logging.info(f"Created blank PDF: {filepath}")
     return filepath
 
-def extract_text_from_pdf_bytes(pdf_bytes):
+def extract_text_from_pdf_bytes(pdf_bytes, max_pages=None):
+    return join_pages(extract_pages_from_pdf_bytes(pdf_bytes, max_pages))
+
+def extract_pages_from_pdf_bytes(pdf_bytes, max_pages=None):
+    """Text of each page; None for pages without a text layer or past `max_pages`."""
+    from PyPDF2 import PdfReader
+    from pdf_preflight import page_has_text_layer
     pdf = PdfReader(BytesIO(pdf_bytes))
-    text = ""
-    for page in pdf.pages:
-        text += page.extract_text() + "\n"
-    return text
+    pages = []
+    for index, page in enumerate(pdf.pages):
+        # Scanned pages have nothing for PyPDF2 to extract
+        if (max_pages is None or index < max_pages) and page_has_text_layer(page):
+            pages.append(page.extract_text())
+        else:
+            pages.append(None)
+    return pages
+
+def join_pages(pages):
+    return "".join(page + "\n" for page in pages if page is not None)
 
 def simple_markdown_to_pdf(cover_content, toc_content, markdown_content):
+    from reportlab.lib.pagesizes import letter
+    from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.lib.enums import TA_JUSTIFY
+
+    if sys.getrecursionlimit() < RENDER_RECURSION_LIMIT:
+        sys.setrecursionlimit(RENDER_RECURSION_LIMIT)
+
     buffer = BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=letter,
                             rightMargin=72, leftMargin=72,
@@ -88,5 +104,4 @@ def simple_markdown_to_pdf(cover_content, toc_content, markdown_content):
     buffer.close()
     return pdf
 
-UTILS_VERSION = "1.0"
-print(f"Utils module version: {UTILS_VERSION}")
\ No newline at end of file
+UTILS_VERSION = "1.0"
\ No newline at end of file